@@ -0,0 +1,130 @@
+"""
+@author: Fernando Bereta dos Reis
+
+file: background_writer.py
+"""
+import threading
+import timeit
+try:
+    import queue
+except ImportError: #python 2
+    import Queue as queue
+
+HDF5_LOCK = threading.Lock() #PyTables is not thread safe, every HDF5 write holds it
+
+###########################################
+# Writer
+###########################################
+class BackgroundWriter(object):
+    """ Writer threads fed through a bounded queue
+
+    The worker submits the writes of a finished home and goes on with the next
+    one while the threads write it. When max_pending writes are waiting submit
+    blocks until a thread takes one, so at most max_pending + threads homes are
+    held in memory whatever the speed of the disk.
+
+    Attributes
+    ----------
+    threads (int): number of writer threads
+    max_pending (int): writes waiting in the queue before submit blocks
+    stats (dict): 'writes', 'write seconds' (spent by the threads), 'blocked seconds'
+        (spent by the worker waiting for room or for flush), 'depth' (sum of the
+        queue depth seen at each submit) and 'max depth'
+    """
+    def __init__(self, threads=1, max_pending=4):
+        """ Start the writer threads
+
+        Parameters
+        ----------
+        threads (int): number of writer threads
+        max_pending (int): writes waiting in the queue before submit blocks
+        """
+        self.threads = threads
+        self.max_pending = max_pending
+        self.stats = {'writes': 0, 'write seconds': 0.0, 'blocked seconds': 0.0, 'depth': 0, 'max depth': 0}
+        self._queue = queue.Queue(max(1, max_pending))
+        self._lock = threading.Lock()
+        self._errors = []
+        self._threads = [threading.Thread(target=self._loop, name='writer%d' % i) for i in range(threads)]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def _loop(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                func, args = job
+                start = timeit.default_timer()
+                try:
+                    func(*args)
+                except Exception as error:
+                    with self._lock:
+                        self._errors.append(error)
+                seconds = timeit.default_timer() - start
+                with self._lock:
+                    self.stats['writes'] += 1
+                    self.stats['write seconds'] += seconds
+            finally:
+                self._queue.task_done()
+
+    def submit(self, func, *args):
+        """ Queue the call func(*args), blocking while the queue is full
+
+        Parameters
+        ----------
+        func (function): write to run in a writer thread
+        args: arguments of func
+        """
+        depth = self._queue.qsize()
+        start = timeit.default_timer()
+        self._queue.put((func, args))
+        with self._lock:
+            self.stats['blocked seconds'] += timeit.default_timer() - start
+            self.stats['depth'] += depth
+            self.stats['max depth'] = max(self.stats['max depth'], depth)
+
+    def flush(self):
+        """ Wait until every submitted write is on disk
+
+        Raises the first error of the writes since the last flush.
+        """
+        start = timeit.default_timer()
+        self._queue.join()
+        with self._lock:
+            self.stats['blocked seconds'] += timeit.default_timer() - start
+            errors, self._errors = self._errors, []
+        if errors:
+            raise errors[0]
+
+    def take(self):
+        """ Statistics since the last take, then start again from zero
+
+        Returns
+        ----------
+        stats (dict): see the stats attribute
+        """
+        with self._lock:
+            stats = self.stats
+            self.stats = {'writes': 0, 'write seconds': 0.0, 'blocked seconds': 0.0, 'depth': 0, 'max depth': 0}
+        return stats
+
+    def close(self):
+        """ Write what is left and stop the threads
+        """
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            raise errors[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
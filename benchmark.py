@@ -0,0 +1,355 @@
+"""
+@author: Fernando Bereta dos Reis
+
+file: benchmark.py
+"""
+from __future__ import print_function
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import main_queue as MQ
+import population_store as PS
+import queue_kernels as QK
+
+###########################################
+# Suites
+###########################################
+#each sweep changes one parameter, the others stay at their default (first entry of the quick suite)
+SUITES = {'quick': {'horizon_days': [1, 2],
+                    'set_size': [100],
+                    'P_U_B': [2],
+                    'workers': [1, 2],
+                    'homes': 3,
+                    'population': 8,
+                    'repeat': 2},
+          'full': {'horizon_days': [1, 7, 30, 365],
+                   'set_size': [25, 100, 400],
+                   'P_U_B': [1.5, 2, 4],
+                   'workers': [1, 2, 4],
+                   'homes': 10,
+                   'population': 64,
+                   'repeat': 3}}
+
+START = '2154-11-06 00:00:00'
+
+###########################################
+# Input data
+###########################################
+def bench_input(folder, days, source='inputdata/'):
+    """ Input folder whose reference load covers the horizon
+
+    The hourly reference of source is repeated until it covers days (plus the
+    day read after END_TIME_Q), so any horizon can be timed with the mock data.
+
+    Parameters
+    ----------
+    folder (str): folder to create the input data in
+    days (int): horizon in days
+    source (str): folder of the input data
+
+    Returns
+    ----------
+    folder (str): input folder for main_queue.setup
+    """
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    load = pd.read_hdf(source + 'load_data.h5')['load']
+    n = (days + 2)*24
+    idx = pd.date_range(START, periods=n, freq='h')
+    pd.DataFrame({'load': np.resize(load.values, n)}, index=idx).to_hdf(os.path.join(folder, 'load_data.h5'), key='load_data')
+    for name in ('ZIP_appliances.csv', 'ZIP_summer.csv', 'ZIP_winter.csv', 'ZIP_spring.csv'):
+        shutil.copy(source + name, folder)
+    return folder + os.sep
+
+###########################################
+# Timing
+###########################################
+def timed(func, repeat):
+    """ Run func repeat times
+
+    Parameters
+    ----------
+    func (function): work to time, called without arguments
+    repeat (int): number of runs
+
+    Returns
+    ----------
+    seconds (list of float): time of each run
+    """
+    seconds = []
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        func()
+        seconds.append(timeit.default_timer() - start)
+    return seconds
+
+def record(case, params, seconds, count, unit):
+    """ Result entry of a case
+
+    Parameters
+    ----------
+    case (str): name of the case
+    params (dict): swept parameters
+    seconds (list of float): time of each run
+    count (int): units done in each run
+    unit (str): what count counts e.g. 'home'
+
+    Returns
+    ----------
+    result (dict): entry of the JSON report, best and median are seconds per unit
+    """
+    per = np.array(seconds) / max(count, 1)
+    result = {'case': case, 'params': params, 'unit': unit, 'count': count,
+              'seconds': seconds, 'best': float(per.min()), 'median': float(np.median(per))}
+    print('%-12s %-40s %10.4f s/%s' % (case, json.dumps(params, sort_keys=True), result['best'], unit))
+    return result
+
+###########################################
+# Cases
+###########################################
+def setup(folder, days, **config):
+    """ Set main_queue.LG for a horizon, writing every output below folder
+
+    Parameters
+    ----------
+    folder (str): scratch folder of the benchmark
+    days (int): horizon in days
+    config (dict): entries overriding main_queue.CONFIG
+
+    Returns
+    ----------
+    LG (load_generation): object used by the solvers
+    """
+    conf = {'START_TIME_Q': START,
+            'END_TIME_Q': str(pd.to_datetime(START) + pd.to_timedelta(days, unit='D')),
+            'physical_machine': 1, 'seed': 0, 'REPORT': None,
+            'input_folder': bench_input(os.path.join(folder, 'input%d' % days), days)}
+    conf.update(config)
+    LG = MQ.setup(conf)
+    for name in ('multy', 'summary'):
+        if not os.path.isdir(os.path.join(folder, name)):
+            os.makedirs(os.path.join(folder, name))
+    LG.OUT_PUT_FILE_NAME_pre = os.path.join(folder, 'multy') + os.sep
+    LG.OUT_PUT_FILE_NAME_summary_pre = os.path.join(folder, 'summary') + os.sep
+    LG.OUT_PUT_STORE = os.path.join(folder, 'population.h5')
+    LG.OUT_PUT_FEEDER = os.path.join(folder, 'feederHDF.h5')
+    return LG
+
+def app_parameters(size):
+    """ Copy of the default APP_parameter_list with another appliance set size
+    """
+    APP_P_L = list(MQ.CONFIG['APP_parameter_list'])
+    APP_P_L[1] = size
+    return APP_P_L
+
+def homes(n):
+    """ Home ids 1 ... n
+    """
+    return [str(x) for x in range(1, n + 1)]
+
+def bench_read_data(folder, suite):
+    results = []
+    for days in suite['horizon_days']:
+        LG = setup(folder, days)
+        IF = os.path.join(folder, 'input%d' % days) + os.sep
+        seconds = timed(lambda: LG.read_data(IF), suite['repeat'])
+        results.append(record('read_data', {'horizon_days': days}, seconds, 1, 'run'))
+    return results
+
+def bench_appset(folder, suite):
+    results = []
+    LG = setup(folder, 1)
+    for size in suite['set_size']:
+        APP_P_L = app_parameters(size)
+        rng = np.random.default_rng(0)
+        seconds = timed(lambda: [MQ.makeAPP(LG.DF_A, LG.DF_ZIP_summer, LG.DF_ZIP_winter, LG.DF_ZIP_spring, APP_P_L, rng,
+                                            LG.app_tables)
+                                 for _ in range(suite['homes'])], suite['repeat'])
+        results.append(record('AppSET', {'set_size': size}, seconds, suite['homes'], 'home'))
+    return results
+
+def bench_home(folder, suite):
+    results = []
+    default = dict(set_size=suite['set_size'][0], P_U_B=suite['P_U_B'][0], horizon_days=suite['horizon_days'][0])
+    points = [dict(default, horizon_days=days) for days in suite['horizon_days']]
+    points += [dict(default, set_size=size) for size in suite['set_size'][1:]]
+    for point in points:
+        for queue, name in ((0, 'home_inf'), (2, 'home_C')):
+            LG = setup(folder, point['horizon_days'], Queue_type=queue, P_U_B=point['P_U_B'],
+                       APP_parameter_list=app_parameters(point['set_size']))
+            seconds = timed(lambda: [MQ.generate_home(x) for x in homes(suite['homes'])], suite['repeat'])
+            results.append(record(name, point, seconds, suite['homes'], 'home'))
+    for pub in suite['P_U_B'][1:]:
+        point = dict(default, P_U_B=pub)
+        LG = setup(folder, point['horizon_days'], Queue_type=2, P_U_B=pub,
+                   APP_parameter_list=app_parameters(point['set_size']))
+        seconds = timed(lambda: [MQ.generate_home(x) for x in homes(suite['homes'])], suite['repeat'])
+        results.append(record('home_C', point, seconds, suite['homes'], 'home'))
+    return results
+
+def bench_write(folder, suite):
+    results = []
+    for days in suite['horizon_days']:
+        LG = setup(folder, days)
+        out = [MQ.generate_home(x) for x in homes(suite['homes'])]
+        seconds = timed(lambda: [MQ.save_HD5(a, b, x) for x, (a, b) in zip(homes(suite['homes']), out)], suite['repeat'])
+        results.append(record('write_files', {'horizon_days': days}, seconds, suite['homes'], 'home'))
+
+        def store():
+            with PS.PopulationWriter(LG.OUT_PUT_STORE) as writer:
+                for x, (a, b) in zip(homes(suite['homes']), out):
+                    writer.append(x, a, b)
+        seconds = timed(store, suite['repeat'])
+        results.append(record('write_store', {'horizon_days': days}, seconds, suite['homes'], 'home'))
+    return results
+
+def bench_population(folder, suite):
+    results = []
+    days = suite['horizon_days'][0]
+    for workers in suite['workers']:
+        for mode in ('files', 'aggregate'):
+            LG = setup(folder, days, NUM_WORKERS=workers, NUM_HOMES=suite['population'], output_mode=mode)
+            seconds = timed(MQ.local, suite['repeat'])
+            results.append(record('population', {'horizon_days': days, 'workers': workers, 'output_mode': mode},
+                                  seconds, suite['population'], 'home'))
+    return results
+
+def bench_sweep(folder, suite):
+    results = []
+    days = suite['horizon_days'][0]
+    points = [(1, suite['P_U_B'][0])] + [(2, pub) for pub in suite['P_U_B']]
+    params = {'horizon_days': days, 'points': len(points)}
+    LG = setup(folder, days, SWEEP=points)
+    seconds = timed(lambda: [MQ.generate_home(x) for x in homes(suite['homes'])], suite['repeat'])
+    results.append(record('sweep', params, seconds, suite['homes'], 'home'))
+
+    def separate():
+        for queue, pub in points:
+            LG.Queue_type, LG.P_U_B = queue, pub
+            for x in homes(suite['homes']):
+                MQ.generate_home(x)
+    LG.SWEEP = None
+    seconds = timed(separate, suite['repeat'])
+    results.append(record('sweep_runs', params, seconds, suite['homes'], 'home'))
+    return results
+
+CASES = {'read_data': bench_read_data,
+         'AppSET': bench_appset,
+         'home': bench_home,
+         'write': bench_write,
+         'population': bench_population,
+         'sweep': bench_sweep}
+
+###########################################
+# Report
+###########################################
+def environment():
+    """ Versions and machine the benchmark ran on
+
+    Returns
+    ----------
+    meta (dict): environment of the run
+    """
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.STDOUT,
+                                         cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__,
+            'pandas': pd.__version__, 'machine': platform.machine(), 'platform': platform.platform(),
+            'cpus': os.cpu_count(), 'backend': QK.BACKEND}
+
+def run(suite='quick', cases=None, folder=None):
+    """ Run the benchmark cases
+
+    Parameters
+    ----------
+    suite (str or dict): name in SUITES or the sweep itself
+    cases (list of str): names in CASES, None = all
+    folder (str): scratch folder, None = a temporary folder removed at the end
+
+    Returns
+    ----------
+    report (dict): 'meta' (environment and suite) and 'results' (one entry per case and sweep point)
+    """
+    sweep = SUITES[suite] if isinstance(suite, str) else suite
+    scratch = folder or tempfile.mkdtemp(prefix='benchmark')
+    results = []
+    try:
+        for name in cases or list(CASES):
+            results.extend(CASES[name](scratch, sweep))
+    finally:
+        if folder is None:
+            shutil.rmtree(scratch, ignore_errors=True)
+    meta = environment()
+    meta['suite'] = sweep
+    return {'meta': meta, 'results': results}
+
+def key(result):
+    """ Case and parameters identifying a result in the reports
+    """
+    return result['case'] + ' ' + json.dumps(result['params'], sort_keys=True)
+
+def compare(report, baseline, tolerance=0.1):
+    """ Compare the best time per unit of each case with a saved baseline
+
+    Parameters
+    ----------
+    report (dict): result of run
+    baseline (dict): report saved from an earlier run
+    tolerance (float): allowed slowdown, 0.1 = 10%
+
+    Returns
+    ----------
+    regressions (list of str): cases slower than the baseline by more than tolerance
+    """
+    base = dict((key(result), result) for result in baseline['results'])
+    regressions = []
+    for result in report['results']:
+        if key(result) not in base:
+            continue
+        ratio = result['best'] / base[key(result)]['best']
+        flag = ''
+        if ratio > 1.0 + tolerance:
+            flag = '  REGRESSION'
+            regressions.append(key(result))
+        print('%-52s %10.4f -> %10.4f  x%.2f%s' % (key(result), base[key(result)]['best'], result['best'], 1.0/ratio, flag))
+    return regressions
+
+def main(argv=None):
+    """ Command line entry point, see python benchmark.py --help
+    """
+    parser = argparse.ArgumentParser(description='Time the load generation and compare with a baseline.')
+    parser.add_argument('--suite', default='quick', choices=sorted(SUITES), help='sweep to run')
+    parser.add_argument('--cases', nargs='+', choices=sorted(CASES), help='cases to run (default all)')
+    parser.add_argument('--out', default='benchmark.json', help='JSON report to write')
+    parser.add_argument('--baseline', help='JSON report to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed slowdown before a case is flagged')
+    parser.add_argument('--folder', help='scratch folder (kept), default a temporary one')
+    args = parser.parse_args(argv)
+    warnings.filterwarnings('ignore', message='object name is not a valid Python identifier') #home ids as HDF5 keys
+
+    report = run(args.suite, args.cases, args.folder)
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print('%d cases slower than the baseline' % len(regressions))
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
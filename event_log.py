@@ -0,0 +1,184 @@
+"""
+@author: Fernando Bereta dos Reis
+
+file: event_log.py
+"""
+import numpy as np
+import pandas as pd
+
+###########################################
+# Format
+###########################################
+#one record per served appliance, times in minutes (19 bytes per event)
+EVENT_DTYPE = np.dtype([('start', '<u4'),      #minutes from the origin
+                        ('duration', '<u2'),   #minutes
+                        ('power', '<f4'),      #active power in Watts
+                        ('SWn', '<u2'),        #shifting window (prior) in minutes
+                        ('SWp', '<u2'),        #shifting window (ahead) in minutes
+                        ('type', '<u2'),       #row of the appliance type in the type dictionary
+                        ('indeX', '<u2'),      #number of the applience id in its set
+                        ('skedulable', 'u1')])
+
+#appliance type dictionary, one row per row of ZIP_appliances.csv
+TYPE_COLUMNS = ['Zp', 'Ip', 'Pp', 'Zq', 'Iq', 'Pq', 'QP'] #QP = Qo/Po, reactive = QP*power
+
+EXTENSION = '.npz' #file extension of the event logs
+
+FRAME_COLUMNS = ['start time', 'duration', 'power', 'skedulable', 'shifting window -', 'shifting window +',
+                 'reactive', 'Zp', 'Ip', 'Pp', 'Zq', 'Iq', 'Pq', 'indeX']
+
+def type_table(DF_A):
+    """ Appliance type dictionary of the event logs
+
+    Parameters
+    ----------
+    DF_A (pandas dataframe): apliences caracteristics
+
+    Returns
+    ----------
+    types (numpy array): TYPE_COLUMNS of each appliance type, types x 7
+    """
+    types = DF_A[TYPE_COLUMNS[:-1]].values.astype(np.float64)
+    return np.column_stack((types, DF_A.Qo.values/DF_A.Po.values))
+
+def encode(t_start, apps):
+    """ Pack the served appliances into event records
+
+    Parameters
+    ----------
+    t_start (numpy array): time each appliance starts being served in minutes from the origin
+    apps (dict of numpy arrays): characteristics of each served appliance, with A_type
+
+    Returns
+    ----------
+    events (numpy array): EVENT_DTYPE records
+    """
+    events = np.empty(len(t_start), dtype=EVENT_DTYPE)
+    events['start'] = np.floor(t_start)
+    events['duration'] = np.rint(apps['duration']*60.0)
+    events['power'] = apps['power']
+    events['SWn'] = np.rint(apps['SWn']*60.0)
+    events['SWp'] = np.rint(apps['SWp']*60.0)
+    events['type'] = apps['A_type']
+    events['indeX'] = apps['indeX']
+    events['skedulable'] = apps['skedulable']
+    return events
+
+###########################################
+# Writer
+###########################################
+def save_events(path, origin, events, types):
+    """ Write an event log
+
+    Parameters
+    ----------
+    path (str): file of the event log (.npz)
+    origin (pandas datetime): time of minute 0
+    events (numpy array): EVENT_DTYPE records (see encode)
+    types (numpy array): appliance type dictionary (see type_table)
+    """
+    with open(path, 'wb') as f:
+        np.savez(f, events=events, types=types, origin=np.array(str(pd.Timestamp(origin))))
+
+###########################################
+# Reader
+###########################################
+class EventLog(object):
+    """ Event log of a home, read lazily
+
+    The records are only read when first used and the complete dataframe is only
+    built by frame (same columns as the HDF5 "multy" output; power and the
+    columns derived from it come back as float32 values).
+
+    Attributes
+    ----------
+    path (str): file of the event log
+    origin (pandas datetime): time of minute 0
+    events (numpy array): EVENT_DTYPE records
+    types (numpy array): appliance type dictionary, types x TYPE_COLUMNS
+    """
+    def __init__(self, path):
+        """ Open an event log
+
+        Parameters
+        ----------
+        path (str): file of the event log (.npz)
+        """
+        self.path = path
+        self._npz = np.load(path)
+        self.origin = pd.Timestamp(str(self._npz['origin']))
+        self._events = None
+        self._types = None
+
+    @property
+    def events(self):
+        """ EVENT_DTYPE records, read on first use
+        """
+        if self._events is None:
+            self._events = self._npz['events']
+        return self._events
+
+    @property
+    def types(self):
+        """ Appliance type dictionary, read on first use
+        """
+        if self._types is None:
+            self._types = self._npz['types']
+        return self._types
+
+    def __len__(self):
+        return len(self.events)
+
+    def start_time(self):
+        """ Start time of each event
+
+        Returns
+        ----------
+        start (pandas DatetimeIndex): time each appliance starts being served
+        """
+        return self.origin + pd.to_timedelta(self.events['start'].astype(np.int64), unit='min')
+
+    def frame(self):
+        """ Complete dataframe of the home
+
+        Returns
+        ----------
+        sagra (pandas dataframe): complete  dataframe
+        """
+        ev = self.events
+        types = self.types[ev['type']]
+        power = ev['power'].astype(np.float64)
+        data = {'start time': self.start_time(),
+                'duration': pd.to_timedelta(ev['duration'].astype(np.int64), unit='min'),
+                'power': power,
+                'skedulable': ev['skedulable'].astype(bool),
+                'shifting window -': pd.to_timedelta(ev['SWn'].astype(np.int64), unit='min'),
+                'shifting window +': pd.to_timedelta(ev['SWp'].astype(np.int64), unit='min'),
+                'reactive': types[:, 6]*power,
+                'indeX': ev['indeX'].astype(np.int64)}
+        for i, name in enumerate(TYPE_COLUMNS[:-1]):
+            data[name] = types[:, i]
+        return pd.DataFrame(data, columns=FRAME_COLUMNS)
+
+    def close(self):
+        self._npz.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def read_events(path):
+    """ Complete dataframe of a home from its event log
+
+    Parameters
+    ----------
+    path (str): file of the event log (.npz)
+
+    Returns
+    ----------
+    sagra (pandas dataframe): complete  dataframe
+    """
+    with EventLog(path) as log:
+        return log.frame()
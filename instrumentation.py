@@ -0,0 +1,216 @@
+"""
+@author: Fernando Bereta dos Reis
+
+file: instrumentation.py
+"""
+from __future__ import print_function
+import csv
+import logging
+import threading
+import timeit
+
+###########################################
+# Collectors
+###########################################
+class Metrics(object):
+    """ Per-phase timers and counters of the homes run in this process (thread safe,
+    the background writer threads add their write time too)
+
+    Attributes
+    ----------
+    seconds (dict): seconds spent in each phase since the last take
+    counts (dict): value of each counter since the last take
+    """
+    def __init__(self):
+        self.seconds = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def phase(self, name):
+        """ Context manager adding the time spent inside it to phase name
+        """
+        return _Phase(self, name)
+
+    def count(self, name, n=1):
+        """ Add n to counter name
+        """
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def take(self):
+        """ Metrics collected since the last take, then start again from zero
+
+        Returns
+        ----------
+        metrics (dict): {'seconds': {phase: seconds}, 'counts': {counter: value}}
+        """
+        with self.lock:
+            metrics = {'seconds': self.seconds, 'counts': self.counts}
+            self.seconds = {}
+            self.counts = {}
+        return metrics
+
+class _Phase(object):
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = timeit.default_timer()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = timeit.default_timer() - self.start
+        with self.metrics.lock:
+            seconds = self.metrics.seconds
+            seconds[self.name] = seconds.get(self.name, 0.0) + elapsed
+
+class _Off(object):
+    """ Disabled collector, every call is a no-op
+    """
+    def phase(self, name):
+        return _NULL_PHASE
+
+    def count(self, name, n=1):
+        pass
+
+    def take(self):
+        return None
+
+class _NullPhase(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+_NULL_PHASE = _NullPhase()
+ACTIVE = _Off() #collector of this process, see enable
+
+def enable(on=True):
+    """ Switch the collection on or off in this process (each pool worker calls it)
+
+    Parameters
+    ----------
+    on (bool): True to collect
+    """
+    global ACTIVE
+    if not on:
+        ACTIVE = _Off()
+    elif not enabled():
+        ACTIVE = Metrics()
+
+def enabled():
+    """ True when the metrics are being collected
+    """
+    return isinstance(ACTIVE, Metrics)
+
+def phase(name):
+    """ Time the block inside it as phase name (nothing when disabled)
+    """
+    return ACTIVE.phase(name)
+
+def count(name, n=1):
+    """ Add n to counter name (nothing when disabled)
+    """
+    ACTIVE.count(name, n)
+
+def take():
+    """ Metrics collected since the last take, None when disabled
+    """
+    return ACTIVE.take()
+
+###########################################
+# Sinks
+###########################################
+class MemorySink(object):
+    """ Keep the metrics of every home in memory
+
+    Attributes
+    ----------
+    records (list of tuples): (home, metrics) in the order they arrived
+    """
+    def __init__(self):
+        self.records = []
+
+    def __call__(self, home, metrics):
+        self.records.append((home, metrics))
+
+    def totals(self):
+        """ Metrics summed over the homes
+
+        Returns
+        ----------
+        metrics (dict): {'seconds': {phase: seconds}, 'counts': {counter: value}}
+        """
+        total = {'seconds': {}, 'counts': {}}
+        for home, metrics in self.records:
+            for kind in total:
+                for name, value in metrics[kind].items():
+                    total[kind][name] = total[kind].get(name, 0) + value
+        return total
+
+    def close(self):
+        pass
+
+class LogSink(object):
+    """ Log one line with the metrics of each home
+
+    Attributes
+    ----------
+    logger (logging.Logger): logger the lines are sent to
+    level (int): logging level of the lines
+    """
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger('load_generation')
+        self.level = level
+
+    def __call__(self, home, metrics):
+        line = ' '.join(['%s=%.4fs' % item for item in sorted(metrics['seconds'].items())] +
+                        ['%s=%d' % item for item in sorted(metrics['counts'].items())])
+        self.logger.log(self.level, 'home %s %s', home, line)
+
+    def close(self):
+        pass
+
+class CSVSink(object):
+    """ Write the metrics of each home to a CSV file, one row per home and metric
+
+    Columns: home, kind ('seconds' or 'counts'), name, value; home is the batch
+    label (see scheduler.batch_label) for the metrics of a vectorized batch
+    """
+    def __init__(self, path):
+        self.file = open(path, 'w')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(['home', 'kind', 'name', 'value'])
+
+    def __call__(self, home, metrics):
+        for kind in ('seconds', 'counts'):
+            for name, value in sorted(metrics[kind].items()):
+                self.writer.writerow([home, kind, name, value])
+
+    def close(self):
+        self.file.close()
+
+def make_sink(spec):
+    """ Sink from its description
+
+    Parameters
+    ----------
+    spec: 'memory', 'log', a path ending in .csv or a callable sink(home, metrics)
+
+    Returns
+    ----------
+    sink: callable receiving (home, metrics) of every home
+    """
+    if spec == 'memory':
+        return MemorySink()
+    if spec == 'log':
+        return LogSink()
+    if isinstance(spec, str) and spec.endswith('.csv'):
+        return CSVSink(spec)
+    if callable(spec):
+        return spec
+    raise ValueError('unknown metrics sink: %r' % (spec,))
@@ -4,12 +4,33 @@
 file: main_queue.py
 """
 from __future__ import print_function
-from scoop import futures
+import argparse
+import copy
+import json
+import logging
 import multiprocessing
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
 import numpy as np 
 import pandas as pd 
 import timeit
+try:
+    from multiprocessing import shared_memory
+except ImportError: #python < 3.8, arrays are shared through memory-mapped files
+    shared_memory = None
 import ZIPapliences as A_ZIP
+import queue_kernels as QK
+import population_store as PS
+import event_log as EL
+import zip_voltage as ZV
+import result_cache as RC
+import background_writer as BW
+import scheduler as SC
+import instrumentation as IN
+import functools
 
 class load_generation:
     """ Class prepares the system for generating load
@@ -20,7 +41,7 @@ class load_generation:
     END_TIME_Q (pandas datetime): end time to generate load data
     Queue_type (int): 0=inf; 1=C; 2=Ct
     P_U_B (int): percentage upper boud --> e.g. 2 = 200% from the reference
-    physical_machine (int): 1 = single node 2 = multiple nodes
+    physical_machine (int): 1 = single node 2 = multiple nodes (scoop), used when BACKEND is None
     NUM_WORKERS (int): number of workers used when generating load in a single node
     NUM_HOMES (int): number of homes being generated
     OUT_PUT_FILE_NAME_pre (str): file path to write output 
@@ -28,6 +49,42 @@ class load_generation:
     OUT_PUT_FILE_NAME_end (str): end of file name
     OUT_PUT_FILE_NAME_summary_pre (str): file path to write output 
     OUT_PUT_FILE_NAME_summary (str): prefix of summary file name to be writen
+    OUT_PUT_STORE (str): file of the population store
+    OUT_PUT_FEEDER (str): file of the feeder aggregate
+    OUT_PUT_ARRAYS (str): folder of the memory-mapped population arrays
+    output_mode (str): 'files' = two HDF5 files per home; 'store' = one population store;
+        'arrays' = W and VAR of every home in memory-mapped arrays (no events);
+        'aggregate' = feeder statistics only, no per-home output
+    FEEDER_EDGES (numpy array): W bins of the feeder percentile sketch (None = no sketch)
+    FEEDER_QUANTILES (list of float): W quantiles of the feeder aggregate
+    BATCH_SIZE (int): homes per task, None = guided batches (large first, small at the end)
+    KERNEL_BATCH (int): homes simulated together by simulate_homes in the feeder aggregation
+    EVENT_FORMAT (str): 'hdf' = complete dataframe in the "multy" files; 'binary' = compact event log (see event_log)
+    STREAM_WINDOW (str): window of the streaming generation e.g. '1 days' (needs the 'files' output mode and 'hdf' events), None = whole horizon at once
+    WRITER_THREADS (int): writer threads per worker saving the per-home files while the next home
+        is generated (also for SWEEP, not with STREAM_WINDOW), 0 = the worker writes each home itself
+    WRITE_QUEUE (int): homes waiting for the writer threads before the worker blocks
+    BACKEND (str): execution backend, 'serial', 'process', 'scoop' or 'shard' (see BACKENDS),
+        None = 'process' or 'scoop' from physical_machine
+    SHARDS (int): number of shards of the 'shard' backend
+    SHARD (int): shard run by this process (0 ... SHARDS-1), None = launch every shard here and merge
+    SHARD_FOLDER (str): folder of the shard manifests
+    SWEEP (list): sweep points [(Queue_type, P_U_B), ...] generated together from the same appliance
+        sets and arrivals of each home, side by side in its files (see sweep_home), None = no sweep;
+        needs the 'files' output mode without STREAM_WINDOW or EVENT_FORMAT='binary'
+    RETRIES (int): times a failed home is tried again
+    REPORT (float): seconds between progress reports, None = silent
+    CACHE_FOLDER (str): folder of the result cache of the per-home files (needs seed), None = no cache
+    CACHE_MAX_BYTES (int): size limit of the result cache, None = no limit
+    CACHE_MAX_ENTRIES (int): number of configurations kept in the result cache, None = no limit
+    REF_CACHE_FOLDER (str): folder of the reference loads already built, None = always build it
+    input_folder (str): folder the input data was read from
+    PROFILE (str): per-phase timers and counters of every home sent to 'memory', 'log' or a .csv file, None = off
+    profile (sink): sink of the last run with PROFILE set (MemorySink.totals for the sums)
+    timings (dict): seconds taken by each home in the last run, or by each batch of homes generated
+        in one call (see scheduler.batch_label)
+    failed (list): homes that failed after all retries in the last run
+    feeder (FeederAggregate): feeder aggregate of the last run in the 'aggregate' output mode
     
     TIME_DELT (pandas datetime): 1 minute 
     TIME_DELT_FH (pandas datetime): 1 hour 
@@ -36,11 +93,23 @@ class load_generation:
     base_max (float): rescaling load reference uper bound 
     base_min (float): rescaling load reference lower bound 
     
+    seed (int): master seed, each home draws from its own stream (see home_rng); None = not reproducible
+    HEMISPHERE (str): north or south, hemisphere of the seasons
+    STRATUM (str or dict): stratum of the appliance participation (P_A ... P_F) of every home, or
+        {stratum: weight} to draw the stratum of each home (mixed population)
+    
     ref_load (pandas series): reference load
     DF_A (pandas dataframe): appliances characteristics
     DF_ZIP_summer (pandas dataframe): appliances participation during the summer
     DF_ZIP_winter (pandas dataframe): appliances participation during the winter
     DF_ZIP_spring (pandas dataframe): appliances participation during the spring
+    app_tables (list of dicts): alias tables of the appliance types of each season and stratum
+    
+    dates (pandas DatetimeIndex): minute index of the reference load
+    horizon (int): minutes from START_TIME_Q to END_TIME_Q
+    ref_arr (numpy array): reference load in Watts (float64, contiguous)
+    season_arr (numpy array): season of each minute (see season)
+    S_W_arr (numpy array): capacity curve of the C limited queue
     
     APP_parameter_list (list): input parameters 
         [(float) p.u. percentage of schedulable appliances 0.5=50%,
@@ -56,7 +125,17 @@ class load_generation:
     -------
     __init__ : create object with the parameters for the load generation
     read_data : load input data
+    reference_load : reference load in minutes
+    prepare_arrays : precompute the minute resolution arrays used by the solvers
+    capacity_curve : capacity curve S_W of the C limited queue
+    strata : strata of STRATUM and the table drawing them
+    share_arrays : place the arrays in shared memory for the workers
+    attach_arrays : use the arrays shared by the parent process
+    release_arrays : free the shared arrays
+    snapshot : serialized copy sent once to each worker
     """
+    SHARED_ARRAYS = ('ref_arr','season_arr','S_W_arr')
+    
     def __init__(self,ST,ET,T,P,M,NW,NH):
         """ Create load_generation object
         
@@ -82,6 +161,35 @@ class load_generation:
         self.OUT_PUT_FILE_NAME_end         = '.h5'
         self.OUT_PUT_FILE_NAME_summary_pre = 'outputdata/summary/'
         self.OUT_PUT_FILE_NAME_summary     = 'summaryHDF'
+        self.OUT_PUT_STORE                 = 'outputdata/population.h5'
+        self.OUT_PUT_FEEDER                = 'outputdata/feederHDF.h5'
+        self.OUT_PUT_ARRAYS                = 'outputdata/population/'
+        self.output_mode                   = 'files'
+        self.FEEDER_EDGES                  = None
+        self.FEEDER_QUANTILES              = []
+        self.BATCH_SIZE                    = None
+        self.KERNEL_BATCH                  = 16
+        self.STREAM_WINDOW                 = None
+        self.EVENT_FORMAT                  = 'hdf'
+        self.WRITER_THREADS                = 0
+        self.WRITE_QUEUE                   = 4
+        self.BACKEND                       = None
+        self.SHARDS                        = 1
+        self.SHARD                         = None
+        self.SHARD_FOLDER                  = 'outputdata/shards/'
+        self.SWEEP                         = None
+        self.RETRIES                       = 2
+        self.REPORT                        = 10.0
+        self.PROFILE                       = None
+        self.CACHE_FOLDER                  = None
+        self.CACHE_MAX_BYTES               = None
+        self.CACHE_MAX_ENTRIES             = None
+        self.REF_CACHE_FOLDER              = None
+        self.input_folder                  = None
+        self.profile                       = None
+        self.timings                       = {}
+        self.failed                        = []
+        self.feeder                        = None
         #Auxiliary variables
         self.TIME_DELT = pd.to_timedelta('0 days 00:01:00')
         self.TIME_DELT_FH = pd.to_timedelta('0 days 01:00:00')
@@ -90,12 +198,29 @@ class load_generation:
         self.base_max  = 5000.0
         self.base_min  =  100.0
         
+        self.seed      = None
+        self.HEMISPHERE = 'north'
+        self.STRATUM    = 'P_D'
+        
         #From data
         self.ref_load = None
         self.DF_A = None
         self.DF_ZIP_summer = None
         self.DF_ZIP_winter = None
         self.DF_ZIP_spring = None
+        self.app_tables = None
+        self._strata = None
+        
+        #Arrays
+        self.dates = None
+        self.horizon = None
+        self.ref_arr = None
+        self.season_arr = None
+        self.S_W_arr = None
+        self._S_W_key = None
+        self._shared = []
+        self._spec = None
+        self._arrays = None
         
         #DEFINITIONS APPLIANCES
         self.APP_parameter_list = [0.5,100,500,100,0.5,0.25,6.0,2.0]
@@ -107,7 +232,41 @@ class load_generation:
         ----------
         IF (str): folder of input data
         """
+        self.input_folder = IF
         # Reference Energy
+        self.ref_load = self.reference_load(IF)
+        # ZIP load
+        self.DF_A = pd.read_csv(IF+'ZIP_appliances.csv')
+        self.DF_ZIP_summer = pd.read_csv(IF+'ZIP_summer.csv')
+        self.DF_ZIP_winter = pd.read_csv(IF+'ZIP_winter.csv')
+        self.DF_ZIP_spring = pd.read_csv(IF+'ZIP_spring.csv')
+        self.app_tables = A_ZIP.participation_tables(self.DF_ZIP_spring,self.DF_ZIP_summer,self.DF_ZIP_winter)
+        
+        self.prepare_arrays()
+        
+    def reference_load(self,IF='inputdata/'):
+        """ Reference load in minutes, read from the REF_CACHE_FOLDER when it was already built
+        
+        Parameters
+        ----------
+        IF (str): folder of input data
+        
+        Returns
+        ----------
+        ref (pandas series): reference load in Watts for each minute
+        """
+        path = None
+        if self.REF_CACHE_FOLDER is not None:
+            config = {'START_TIME_Q': str(self.START_TIME_Q),
+                      'END_TIME_Q': str(self.END_TIME_Q),
+                      'base_max': self.base_max,
+                      'base_min': self.base_min}
+            path = os.path.join(self.REF_CACHE_FOLDER,'ref'+RC.config_key(config,[IF+'load_data.h5'])+'.npz')
+            if os.path.exists(path):
+                with np.load(path) as data:
+                    index = pd.date_range(str(data['start']),periods=len(data['ref']),freq=self.TIME_DELT)
+                    return pd.Series(data['ref'],index=index,name='Load [W]')
+        
         sys_load = pd.read_hdf(IF+'load_data.h5')
         sys_load = sys_load['load']
         sys_load = sys_load[self.START_TIME_Q:self.END_TIME_Q+self.TIME_DELT_FD]#*1e6 #DATA IS IN HOURS
@@ -116,18 +275,149 @@ class load_generation:
         scale_min = sys_load[self.START_TIME_Q:self.END_TIME_Q].min()
         scale_max = sys_load[self.START_TIME_Q:self.END_TIME_Q].max()
         
-        ref = sys_load
+        hourly = self.base_min+((sys_load.values-scale_min)/(scale_max-scale_min))*(self.base_max-self.base_min)
+        #order 0 interpolation: every minute takes the value of its hour, up to the last hour stamp
+        per_hour = int(self.TIME_DELT_FH // self.TIME_DELT)
+        n = (len(hourly)-1)*per_hour+1 if len(hourly) else 0
+        ref = np.repeat(hourly,per_hour)[:n]
+        index = pd.date_range(sys_load.index[0],periods=n,freq=self.TIME_DELT) if n else pd.DatetimeIndex([])
         
-        ref = self.base_min+((ref-scale_min)/(scale_max-scale_min))*(self.base_max-self.base_min)
-        ref.name = 'Load [W]'
-        ref = ref.resample(self.TIME_DELT).max().interpolate(method='polynomial', order=0,limit_direction='forward')
+        if path is not None:
+            if not os.path.isdir(self.REF_CACHE_FOLDER):
+                os.makedirs(self.REF_CACHE_FOLDER)
+            with open(path+'.tmp','wb') as f:
+                np.savez(f,ref=ref,start=np.array(str(index[0]) if n else ''))
+            os.replace(path+'.tmp',path)
+        return pd.Series(ref,index=index,name='Load [W]')
         
-        self.ref_load = ref
-        # ZIP load
-        self.DF_A = pd.read_csv(IF+'ZIP_appliances.csv')
-        self.DF_ZIP_summer = pd.read_csv(IF+'ZIP_summer.csv')
-        self.DF_ZIP_winter = pd.read_csv(IF+'ZIP_winter.csv')
-        self.DF_ZIP_spring = pd.read_csv(IF+'ZIP_spring.csv')
+    def prepare_arrays(self):
+        """ Precompute the minute resolution arrays used by the solvers
+        
+        The arrival rate lam(t) = m(t + E[D])/(E[D]E[L]) of a home is ref_arr
+        shifted and scaled by the E[D] and E[L] of its appliance sets, so only the
+        home independent part (ref_arr and season_arr) is precomputed.
+        """
+        self.dates = self.ref_load.index
+        self.horizon = int((self.END_TIME_Q - self.START_TIME_Q) // self.TIME_DELT)
+        self.ref_arr = np.ascontiguousarray(self.ref_load.values,dtype=np.float64)
+        self.season_arr = season_index(self.dates,self.HEMISPHERE)
+        self.S_W_arr = None
+        self.capacity_curve()
+        
+    def capacity_curve(self):
+        """ Capacity curve S_W of the C limited queue, recomputed if Queue_type or P_U_B changed
+        
+        Returns
+        ----------
+        S_W (numpy array): capacity in Watts for each minute
+        """
+        key = (self.Queue_type,self.P_U_B)
+        if self.S_W_arr is None or self._S_W_key != key:
+            self.S_W_arr = capacity(self.ref_arr,self.horizon,self.Queue_type,self.P_U_B)
+            self._S_W_key = key
+        return self.S_W_arr
+        
+    def strata(self):
+        """ Strata of STRATUM and the alias table drawing them, rebuilt if STRATUM changed
+        
+        Returns
+        ----------
+        names (list of str): strata of the population
+        table (AliasTable): draws the position in names of a home, None for a single stratum
+        """
+        if self._strata is None or self._strata[0] != self.STRATUM:
+            if isinstance(self.STRATUM,dict):
+                names = sorted(self.STRATUM)
+                table = A_ZIP.AliasTable([self.STRATUM[name] for name in names])
+            else:
+                names,table = [self.STRATUM],None
+            for name in names:
+                if name not in A_ZIP.STRATA:
+                    raise ValueError('STRATUM must be in %s, not %r' % (', '.join(A_ZIP.STRATA),name))
+            self._strata = (self.STRATUM,names,table)
+        return self._strata[1:]
+        
+    def share_arrays(self,folder=None):
+        """ Place the precomputed arrays in shared memory (or memory-mapped files)
+        
+        Parameters
+        ----------
+        folder (str): folder for memory-mapped files, None uses shared memory when available
+        
+        Returns
+        ----------
+        spec (dict): how to attach each array, argument of attach_arrays
+        """
+        self.capacity_curve()
+        spec = {}
+        for name in self.SHARED_ARRAYS:
+            arr = getattr(self,name)
+            if folder is None and shared_memory is not None:
+                shm = shared_memory.SharedMemory(create=True,size=max(arr.nbytes,1))
+                self._shared.append(shm)
+                spec[name] = ('shm',shm.name,arr.shape,arr.dtype.str)
+                view = np.ndarray(arr.shape,arr.dtype,buffer=shm.buf)
+                view[:] = arr
+            else:
+                if folder is None:
+                    folder = tempfile.mkdtemp()
+                path = os.path.join(folder,name+'.npy')
+                np.save(path,arr)
+                spec[name] = ('file',path,arr.shape,arr.dtype.str)
+                view = np.load(path,mmap_mode='r')
+            view.flags.writeable = False
+            setattr(self,name,view)
+        self._spec = spec
+        return spec
+        
+    def attach_arrays(self,spec):
+        """ Use the arrays shared by the parent process instead of local copies
+        
+        Parameters
+        ----------
+        spec (dict): returned by share_arrays
+        """
+        for name,(kind,where,shape,dtype) in spec.items():
+            if kind == 'shm':
+                shm = shared_memory.SharedMemory(name=where)
+                self._shared.append(shm) #keep the block open while in use
+                view = np.ndarray(shape,dtype,buffer=shm.buf)
+            else:
+                view = np.load(where,mmap_mode='r')
+            view.flags.writeable = False
+            setattr(self,name,view)
+        self._S_W_key = (self.Queue_type,self.P_U_B)
+        self._spec = spec
+        
+    def release_arrays(self):
+        """ Free the shared arrays created by share_arrays (parent process)
+        """
+        for name in self.SHARED_ARRAYS:
+            setattr(self,name,np.array(getattr(self,name)))
+        for shm in self._shared:
+            shm.close()
+            shm.unlink()
+        self._shared = []
+        self._spec = None
+        
+    def snapshot(self):
+        """ Serialized copy of the object, made once and sent to each worker
+        
+        Returns
+        ----------
+        snapshot (bytes): pickled object, without the arrays that are shared
+        """
+        return pickle.dumps(self,pickle.HIGHEST_PROTOCOL)
+        
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_shared'] = []
+        state['_arrays'] = None #each process opens its own memory map
+        if self._spec is not None: #attached again with attach_arrays
+            for name in self.SHARED_ARRAYS:
+                state[name] = None
+            state['ref_load'] = None #the workers only use the arrays
+        return state
         
 ###########################################
 # save data to file
@@ -141,14 +431,87 @@ def save_HD5(a,b,x):
     b (pandas dataframe): summary dataframe
     x (str): string number of the individual home id
     """
-    a.to_hdf(LG.OUT_PUT_FILE_NAME_pre+LG.OUT_PUT_FILE_NAME+x+LG.OUT_PUT_FILE_NAME_end, key=x,format='table',mode='w',dropna = True)
-    b.to_hdf(LG.OUT_PUT_FILE_NAME_summary_pre+LG.OUT_PUT_FILE_NAME_summary+x+LG.OUT_PUT_FILE_NAME_end, key=x,format='table',mode='w',dropna = True)
+    with IN.phase('write'), BW.HDF5_LOCK:
+        a.to_hdf(LG.OUT_PUT_FILE_NAME_pre+LG.OUT_PUT_FILE_NAME+x+LG.OUT_PUT_FILE_NAME_end, key=x,format='table',mode='w',dropna = True)
+        b.to_hdf(LG.OUT_PUT_FILE_NAME_summary_pre+LG.OUT_PUT_FILE_NAME_summary+x+LG.OUT_PUT_FILE_NAME_end, key=x,format='table',mode='w',dropna = True)
+    count_written(LG.OUT_PUT_FILE_NAME_pre+LG.OUT_PUT_FILE_NAME+x+LG.OUT_PUT_FILE_NAME_end,
+                  LG.OUT_PUT_FILE_NAME_summary_pre+LG.OUT_PUT_FILE_NAME_summary+x+LG.OUT_PUT_FILE_NAME_end)
     return None
 
+def save_binary(t_start,apps,b,x):
+    """ Save the generated load with the events in the compact event log format
+    
+    Parameters
+    ----------
+    t_start (numpy array): time each appliance starts being served in minutes from START_TIME_Q
+    apps (dict of numpy arrays): characteristics of each served appliance (see app_columns)
+    b (pandas dataframe): summary dataframe
+    x (str): string number of the individual home id
+    """
+    with IN.phase('write'):
+        keep = np.floor(t_start) <= LG.horizon #same events as the complete dataframe
+        events = EL.encode(t_start[keep],{name: apps[name][keep] for name in apps})
+        EL.save_events(LG.OUT_PUT_FILE_NAME_pre+LG.OUT_PUT_FILE_NAME+x+EL.EXTENSION,LG.START_TIME_Q,events,EL.type_table(LG.DF_A))
+        with BW.HDF5_LOCK:
+            b.to_hdf(LG.OUT_PUT_FILE_NAME_summary_pre+LG.OUT_PUT_FILE_NAME_summary+x+LG.OUT_PUT_FILE_NAME_end, key=x,format='table',mode='w',dropna = True)
+    count_written(LG.OUT_PUT_FILE_NAME_pre+LG.OUT_PUT_FILE_NAME+x+EL.EXTENSION,
+                  LG.OUT_PUT_FILE_NAME_summary_pre+LG.OUT_PUT_FILE_NAME_summary+x+LG.OUT_PUT_FILE_NAME_end)
+
+def count_written(*paths):
+    """ Count the bytes of the home files (instrumentation)
+    
+    Parameters
+    ----------
+    paths (str): files written for the home
+    """
+    if IN.enabled():
+        IN.count('bytes written',sum(os.path.getsize(path) for path in paths))
+
+def capacity(ref,horizon,Queue_type,P_U_B):
+    """ Capacity curve S_W of a queue type
+    
+    Parameters
+    ----------
+    ref (numpy array): reference load in Watts at minute resolution
+    horizon (int): minutes from START_TIME_Q to END_TIME_Q
+    Queue_type (int): 0=inf; 1=C; 2=Ct
+    P_U_B (float): percentage upper boud --> e.g. 2 = 200% from the reference
+    
+    Returns
+    ----------
+    S_W (numpy array): capacity in Watts for each minute
+    """
+    if Queue_type == 1:
+        return np.full(len(ref),ref[:horizon+1].max()*P_U_B)
+    if Queue_type == 2:
+        return ref*P_U_B
+    return np.full(len(ref),np.inf)
+
+###########################################
+#Random streams
+###########################################
+def home_rng(seed,x):
+    """ Random generator of an individual home
+    
+    The stream of home x is child x of SeedSequence(seed), i.e. the same as
+    SeedSequence(seed).spawn(x+1)[x], so any home can be regenerated on its own
+    and the results do not depend on which worker runs which home.
+    
+    Parameters
+    ----------
+    seed (int): master seed (None draws fresh entropy)
+    x (str): string number of the individual home id
+    
+    Returns
+    ----------
+    rng (numpy Generator): random generator of the home
+    """
+    return np.random.default_rng(np.random.SeedSequence(seed,spawn_key=(int(x),)))
+
 ###########################################
 #APLAENCES seasson 
 ###########################################
-def makeAPP(DF_A,DF_ZIP_summer,DF_ZIP_winter,DF_ZIP_spring,APP_P_L):
+def makeAPP(DF_A,DF_ZIP_summer,DF_ZIP_winter,DF_ZIP_spring,APP_P_L,rng=None,tables=None,stratum='P_D'):
     """ Generate individual appliances set for homes during the season of the year
     
     Parameters
@@ -157,24 +520,44 @@ def makeAPP(DF_A,DF_ZIP_summer,DF_ZIP_winter,DF_ZIP_spring,APP_P_L):
     DF_ZIP_summer (pandas dataframe): appliances participation during the summer
     DF_ZIP_winter (pandas dataframe): appliances participation during the winter
     DF_ZIP_spring (pandas dataframe): appliances participation during the spring
+    APP_P_L (list): input parameters (see load_generation.APP_parameter_list)
+    rng (numpy Generator): random generator of the home
+    tables (list of dicts): alias tables of A_ZIP.participation_tables, built here if None
+    stratum (str): stratum of the appliance participation, P_A ... P_F (P_D from the ZIP study paper)
     
     Returns
     ----------
     APP_L_obj (list of applience objecs): applience objects list for seasons 
     """
-    strataN=4 #from the ZIP study paper
+    if tables is None:
+        tables = A_ZIP.participation_tables(DF_ZIP_spring,DF_ZIP_summer,DF_ZIP_winter)
     c_index = np.array(DF_ZIP_summer['A_index'])
-    c_winter = np.array(DF_ZIP_winter.iloc[:,strataN])
-    c_spring = np.array(DF_ZIP_spring.iloc[:,strataN])
-    c_summer = np.array(DF_ZIP_summer.iloc[:,strataN])
     
     APP_L_obj = []
-    APP_L_obj.append(A_ZIP.AppSET(DF_A,c_index,c_spring,APP_P_L))
-    APP_L_obj.append(A_ZIP.AppSET(DF_A,c_index,c_summer,APP_P_L))
-    APP_L_obj.append(A_ZIP.AppSET(DF_A,c_index,c_winter,APP_P_L))
+    with IN.phase('appliances'):
+        for season_tables in tables: #spring, summer, winter
+            APP_L_obj.append(A_ZIP.AppSET(DF_A,c_index,season_tables[stratum],APP_P_L,rng))
     
     return APP_L_obj
 
+def home_appliances(rng):
+    """ Appliance sets of a home with the tables and STRATUM of LG
+    
+    Parameters
+    ----------
+    rng (numpy Generator): random generator of the home
+    
+    Returns
+    ----------
+    APP_L_obj (list of applience objecs): applience objects list for seasons 
+    """
+    names,table = LG.strata()
+    stratum = names[0] if table is None else names[int(table.sample(rng,1)[0])]
+    return makeAPP(LG.DF_A,LG.DF_ZIP_summer,LG.DF_ZIP_winter,LG.DF_ZIP_spring,LG.APP_parameter_list,rng,LG.app_tables,stratum)
+
+SEASON_SET = np.array([0,1,0,2]) #appliance set (0=spring and fall, 1=summer, 2=winter) of each season of SEASONS
+SEASONS = ('spring','summer','fall','winter')
+
 def season(date, HEMISPHERE = 'north'):
     """ Informe season of the year
     
@@ -187,150 +570,258 @@ def season(date, HEMISPHERE = 'north'):
     ----------
     s (int): indicates the season 
     """
-    md = date.month * 100 + date.day
-
-    if ((md > 320) and (md < 621)):
-        s = 0 #spring
-    elif ((md > 620) and (md < 923)):
-        s = 1 #summer
-    elif ((md > 922) and (md < 1223)):
-        s = 2 #fall
-    else:
-        s = 3 #winter
-
-    if not HEMISPHERE == 'north':
-        s = (s + 2) % 3
-        
-    if s ==2:
-        s=0 #spring and fall have same loads
-    if s == 3:
-        s=2
-    return s
+    return int(season_index(pd.DatetimeIndex([date]),HEMISPHERE)[0])
 
-def SeasonUPdate(temp):
-    """ Update appliance characteristics given the change in season
+def season_index(dates, HEMISPHERE = 'north'):
+    """ Season of the year for every time stamp
+    
+    The northern season boundaries are 21 March, 21 June, 23 September and
+    23 December; the southern hemisphere is half a year apart (spring <-> fall,
+    summer <-> winter). Spring and fall share an appliance set, so the index is
+    0 = spring or fall, 1 = summer, 2 = winter.
     
     Parameters
     ----------
-    temp (obj): appliance set object for an individual season
+    dates (pandas DatetimeIndex): time stamps being generated
+    HEMISPHERE (str): north or south hemisphere
     
     Returns
     ----------
-    app_expected_load (float): expected load power in Watts
-    app_expected_dur (float): expected duration in hours
-    appliance_set (list of applience objects): applience list for a given season
-    t_delta_exp_dur (pandas datetime): expected appliance duration
-    app_index (array): index for each applience
+    s (numpy array): season of each time stamp, index into the appliance sets of makeAPP
     """
-    app_expected_load = temp.app_expected_load
-    app_expected_dur = temp.app_expected_dur
-    appliance_set = temp.appliance_set
-    t_delta_exp_dur = temp.t_delta_exp_dur
-    app_index = np.arange(0,len(temp.appliance_set))
+    if HEMISPHERE not in ('north','south'):
+        raise ValueError('HEMISPHERE must be north or south, not %r' % (HEMISPHERE,))
+    md = np.asarray(dates.month)*100 + np.asarray(dates.day)
+    s = np.full(len(md),3,dtype=np.int64) #winter
+    s[(md > 320) & (md < 621)] = 0 #spring
+    s[(md > 620) & (md < 923)] = 1 #summer
+    s[(md > 922) & (md < 1223)] = 2 #fall
+    if HEMISPHERE == 'south':
+        s = (s + 2) % 4
+    return SEASON_SET[s]
+
+def season_expectations(APP_L_obj):
+    """ Expected load and duration of the appliance set of each season
     
-    return app_expected_load,app_expected_dur,appliance_set,t_delta_exp_dur,app_index
+    Parameters
+    ----------
+    APP_L_obj (list of applience objecs): applience objects list for seasons 
+    
+    Returns
+    ----------
+    exp_load (numpy array): expected load in Watts, indexed by season_index
+    exp_dur (numpy array): expected duration in hours, indexed by season_index
+    """
+    return (np.array([temp.app_expected_load for temp in APP_L_obj]),
+            np.array([temp.app_expected_dur for temp in APP_L_obj]))
 
 ###########################################
-#MAKE QUEUE MODEL C = infinity 
+#Appliance runs to load
 ###########################################
-def solverZIPl_inf(x):
-    """ Generate load with C = infinity
+APP_COLUMNS = list(A_ZIP.AppSET.COLUMNS) + ['A_type']
+
+def app_columns(APP_L_obj,s_arrival,a_arrival):
+    """ Gather the characteristics of the appliance served at each arrival
     
     Parameters
     ----------
-    x (str): string number of the individual home id
+    APP_L_obj (list of applience objecs): applience objects list for seasons 
+    s_arrival (numpy array): season of each arrival
+    a_arrival (numpy array): index of the applience in the set of its season
     
     Returns
     ----------
-    x (str): string number of the individual home id
+    apps (dict of numpy arrays): one array per name in APP_COLUMNS
     """
-    START_TIME_Q = LG.START_TIME_Q
-    END_TIME_Q   = LG.END_TIME_Q
-    ref_load     = LG.ref_load
-    current_time = START_TIME_Q
+    offset = np.cumsum([0]+[len(temp) for temp in APP_L_obj])[:-1]
+    pick = offset[s_arrival] + a_arrival
+    apps = {}
+    for name in APP_COLUMNS:
+        apps[name] = np.concatenate([getattr(temp,name) for temp in APP_L_obj])[pick]
+    return apps
 
-    customer_loads_GL = (ref_load*0.0).copy()
-    customer_loads_GL_VAR = (ref_load*0.0).copy()
+def queue_output(dates,START_TIME_Q,END_TIME_Q,t_start,apps):
+    """ Build the complete and summary dataframes of a home
     
-    L1=[];L2=[];L3=[];L4=[];L5=[];L6=[];L7=[];L8=[];L9=[];L10=[];L11=[];L12=[];L13=[];L14=[];
-    L1=list();L2=list();L3=list();L4=list();L5=list();L6=list();L7=list()
-    L8=list();L9=list();L10=list();L11=list();L12=list();L13=list();L14=list();
+    Parameters
+    ----------
+    dates (pandas DatetimeIndex): minute index of the reference load
+    START_TIME_Q (pandas datetime): start time to generate load data
+    END_TIME_Q (pandas datetime): end time to generate load data
+    t_start (numpy array): time each appliance starts being served in minutes from START_TIME_Q
+    apps (dict of numpy arrays): characteristics of each served appliance (see app_columns)
     
-    APP_L_obj = makeAPP(LG.DF_A,LG.DF_ZIP_summer,LG.DF_ZIP_winter,LG.DF_ZIP_spring,LG.APP_parameter_list)
-    app_expected_load,app_expected_dur,appliance_set,t_delta_exp_dur,app_index = SeasonUPdate(APP_L_obj[season(current_time,'north')])
+    Returns
+    ----------
+    sagra (pandas dataframe): complete  dataframe
+    activeANDreactive (pandas dataframe): summary dataframe
+    """
+    with IN.phase('output'):
+        sagra = events_frame(dates,START_TIME_Q,END_TIME_Q,t_start,apps)
+        activeANDreactive = summary_frame(dates,START_TIME_Q,END_TIME_Q,t_start,apps)
+    return sagra,activeANDreactive
+
+def summary_frame(dates,START_TIME_Q,END_TIME_Q,t_start,apps):
+    """ Build the summary dataframe of a home
     
-    dates = ref_load.index
-    while current_time < END_TIME_Q:
-        m_t_plus_delta = ref_load.asof(where=current_time+t_delta_exp_dur)
-        lambda_t = m_t_plus_delta / (app_expected_load*app_expected_dur) #lam(t) = m(t + E[D])/(E[D]E[L])
-        
-        delta_t = np.random.exponential(1.0/lambda_t) #lambda_t is the rate parameter, numpy requires the scale which is the reciprocal of rate. Alternatively can switch the calculation of lambda_t, but this way matches the derived equations.
-        if delta_t < 0.00000003:
-            delta_t = 0.00000003
-        current_time += pd.to_timedelta('%s s' % (delta_t*3600.0)) #converted to seconds as some delta_t in hours was too small for pandas to parse correctly
-        
-        if current_time < END_TIME_Q: #check after time is updated we are still in sim time
-            ###########################################
-            #Season 
-            ###########################################
-            app_expected_load,app_expected_dur,appliance_set,t_delta_exp_dur,app_index = SeasonUPdate(APP_L_obj[season(current_time,'north')])
+    Parameters
+    ----------
+    dates (pandas DatetimeIndex): minute index of the reference load
+    START_TIME_Q (pandas datetime): start time to generate load data
+    END_TIME_Q (pandas datetime): end time to generate load data
+    t_start (numpy array): time each appliance starts being served in minutes from START_TIME_Q
+    apps (dict of numpy arrays): characteristics of each served appliance (see app_columns)
+    
+    Returns
+    ----------
+    activeANDreactive (pandas dataframe): summary dataframe
+    """
+    n = len(dates)
+    start_idx = np.floor(t_start).astype(np.int64)
+    end_idx = np.minimum(np.floor(t_start + apps['duration']*60.0).astype(np.int64), n - 1)
+    customer_loads_GL,customer_loads_GL_VAR = QK.accumulate_load(start_idx,end_idx,apps['power'],apps['reactive'],n)
+    
+    activeANDreactive = pd.DataFrame({'W':customer_loads_GL, 'VAR':customer_loads_GL_VAR},index=dates)
+    return activeANDreactive[START_TIME_Q:END_TIME_Q]
 
-            app = appliance_set[np.random.choice(app_index,size=1,replace=True)[0]]
-            add_time = current_time
-            
-            this_app_endtime = add_time + pd.to_timedelta('%s h' % app.duration)
-            this_app_curtime = add_time
-            
-            customer_loads_GL[dates.asof(this_app_curtime):dates.asof(this_app_endtime)] += app.power
-            customer_loads_GL_VAR[dates.asof(this_app_curtime):dates.asof(this_app_endtime)] += app.reactive
-            
-            L1.append(dates.asof(this_app_curtime))#['start time']=dates.asof(this_app_curtime)
-            L2.append(pd.to_timedelta('%s h' % app.duration).round('1min'))#['duration']=pd.to_timedelta('%s h' % app.duration).round('1min')
-            L3.append(app.power)#['power']=app.power
-            L4.append(app.skedulable)#['skedulable']=app.skedulable
-            L5.append(pd.to_timedelta('%s h' % app.SWn).round('1min'))#['shifting window -']=pd.to_timedelta('%s h' % app.SWn).round('1min')
-            L6.append(pd.to_timedelta('%s h' % app.SWp).round('1min'))#['shifting window +']=pd.to_timedelta('%s h' % app.SWp).round('1min')
-            L7.append(app.reactive)#['reactive']=app.reactive
-            L8.append(app.Zp)#['Zp']=app.Zp
-            L9.append(app.Ip)#['Ip']=app.Ip
-            L10.append(app.Pp)#['Pp']=app.Pp
-            L11.append(app.Zq)#['Zq']=app.Zq
-            L12.append(app.Iq)#['Iq']=app.Iq
-            L13.append(app.Pq)#['Pq']=app.Pq
-            L14.append(app.indeX)#['indeX']=app.indeX
-            
-    sagra = pd.DataFrame({'start time': L1,
-                 'duration': L2,
-                 'power': L3,
-                 'skedulable': L4,
-                 'shifting window -': L5,
-                 'shifting window +': L6,
-                 'reactive': L7,
-                 'Zp': L8,
-                 'Ip': L9,
-                 'Pp': L10,
-                 'Zq': L11,
-                 'Iq': L12,
-                 'Pq': L13,
-                 'indeX': L14
+def events_frame(dates,START_TIME_Q,END_TIME_Q,t_start,apps):
+    """ Build the complete dataframe of the served appliances
+    
+    Parameters
+    ----------
+    dates (pandas DatetimeIndex): minute index of the reference load
+    START_TIME_Q (pandas datetime): start time to generate load data
+    END_TIME_Q (pandas datetime): end time to generate load data
+    t_start (numpy array): time each appliance starts being served in minutes from START_TIME_Q
+    apps (dict of numpy arrays): characteristics of each served appliance (see app_columns)
+    
+    Returns
+    ----------
+    sagra (pandas dataframe): complete  dataframe
+    """
+    start_idx = np.floor(t_start).astype(np.int64)
+    sagra = pd.DataFrame({'start time': dates[start_idx],
+                 'duration': pd.to_timedelta(apps['duration'],unit='h').round('1min'),
+                 'power': apps['power'],
+                 'skedulable': apps['skedulable'],
+                 'shifting window -': pd.to_timedelta(apps['SWn'],unit='h').round('1min'),
+                 'shifting window +': pd.to_timedelta(apps['SWp'],unit='h').round('1min'),
+                 'reactive': apps['reactive'],
+                 'Zp': apps['Zp'],
+                 'Ip': apps['Ip'],
+                 'Pp': apps['Pp'],
+                 'Zq': apps['Zq'],
+                 'Iq': apps['Iq'],
+                 'Pq': apps['Pq'],
+                 'indeX': apps['indeX']
                 })     
 
     sagra = sagra[sagra['start time'] >= START_TIME_Q]
     sagra = sagra.reset_index(drop=True)
     sagra = sagra[sagra['start time'] <= END_TIME_Q]
     sagra = sagra.reset_index(drop=True)
+    return sagra
+
+###########################################
+#Arrivals
+###########################################
+def queue_arrivals(APP_L_obj,ref,s_idx,horizon,rng,lam=None):
+    """ Draw every arrival of a home over the whole horizon
+    
+    Parameters
+    ----------
+    APP_L_obj (list of applience objecs): applience objects list for seasons 
+    ref (numpy array): reference load in Watts at minute resolution
+    s_idx (numpy array): season of each minute
+    horizon (int): minutes from START_TIME_Q to END_TIME_Q
+    rng (numpy Generator): random generator of the home
+    lam (numpy array): arrival rate of the home if already computed
+    
+    Returns
+    ----------
+    t_arrival (numpy array): arrival times in minutes from START_TIME_Q
+    apps (dict of numpy arrays): characteristics of the appliance of each arrival
+    """
+    with IN.phase('arrivals'):
+        if lam is None:
+            exp_load,exp_dur = season_expectations(APP_L_obj)
+            lam = QK.intensity(ref,s_idx[:horizon],exp_load,exp_dur) #lam(t) = m(t + E[D])/(E[D]E[L])
+        t_arrival = QK.arrival_times(lam,rng)
+        
+        ###########################################
+        #Season 
+        ###########################################
+        s_arrival = s_idx[t_arrival.astype(np.int64)]
+        set_size = np.array([len(temp) for temp in APP_L_obj])
+        apps = app_columns(APP_L_obj,s_arrival,rng.integers(0,set_size[s_arrival]))
+    IN.count('arrivals',len(t_arrival))
+    return t_arrival,apps
+
+def place_arrivals(headroom,t_arrival,apps,W_TIME):
+    """ Serve the arrivals of a home at their first start under the capacity
+    
+    When instrumented, counts the shift search iterations (one per minute an
+    appliance is delayed) and the appliances that hit the W_TIME cap.
+    
+    Parameters
+    ----------
+    headroom (numpy array): capacity minus committed load in Watts, updated in place
+    t_arrival (numpy array): arrival times in minutes
+    apps (dict of numpy arrays): characteristics of the appliance of each arrival
+    W_TIME (int): shifting window in minutes
+    
+    Returns
+    ----------
+    t_start (numpy array): time each appliance starts being served in minutes
+    """
+    with IN.phase('placement'):
+        t_start = QK.place_appliances(headroom,t_arrival,apps['duration'],apps['power'],W_TIME)
+    if IN.enabled():
+        shift = np.rint(t_start - t_arrival)
+        IN.count('shift iterations',int(shift.sum()))
+        IN.count('cap failures',int(np.count_nonzero(shift > W_TIME)))
+    return t_start
+
+###########################################
+#MAKE QUEUE MODEL C = infinity 
+###########################################
+def loadZIPl_inf(x):
+    """ Generate load with C = infinity
     
-    customer_loads_GL = customer_loads_GL[START_TIME_Q:END_TIME_Q]
-    customer_loads_GL_VAR = customer_loads_GL_VAR[START_TIME_Q:END_TIME_Q]
-    activeANDreactive = pd.DataFrame({'W':customer_loads_GL, 'VAR':customer_loads_GL_VAR})
+    Parameters
+    ----------
+    x (str): string number of the individual home id
+    
+    Returns
+    ----------
+    sagra (pandas dataframe): complete  dataframe
+    activeANDreactive (pandas dataframe): summary dataframe
+    """
+    rng = home_rng(LG.seed,x)
+    APP_L_obj = home_appliances(rng)
+    t_arrival,apps = queue_arrivals(APP_L_obj,LG.ref_arr,LG.season_arr,LG.horizon,rng)
+    
+    return queue_output(LG.dates,LG.START_TIME_Q,LG.END_TIME_Q,t_arrival,apps)
+
+def solverZIPl_inf(x):
+    """ Generate load with C = infinity and save it to the home files
+    
+    Parameters
+    ----------
+    x (str): string number of the individual home id
     
+    Returns
+    ----------
+    x (str): string number of the individual home id
+    """
+    sagra,activeANDreactive = loadZIPl_inf(x)
     save_HD5(sagra,activeANDreactive,x)
     return x
 
 ###########################################
 #MAKE QUEUE MODEL C <-- limited
 ###########################################
-def solverZIPl_C(x):
+def loadZIPl_C(x):
     """ Generate load with C <-- limited
     
     Parameters
@@ -339,158 +830,998 @@ def solverZIPl_C(x):
     
     Returns
     ----------
-    x (str): string number of the individual home id
+    sagra (pandas dataframe): complete  dataframe
+    activeANDreactive (pandas dataframe): summary dataframe
     """
-    START_TIME_Q = LG.START_TIME_Q
-    END_TIME_Q   = LG.END_TIME_Q
-    P_U_B        = LG.P_U_B
-    ref_load     = LG.ref_load
-    TIME_DELT    = LG.TIME_DELT
-    
-    current_time = START_TIME_Q
-    customer_loads_GL = (ref_load*0.0).copy()
-    customer_loads_GL_VAR = (ref_load*0.0).copy()
-    
-    L1=[];L2=[];L3=[];L4=[];L5=[];L6=[];L7=[];L8=[];L9=[];L10=[];L11=[];L12=[];L13=[];L14=[];
-    L1=list();L2=list();L3=list();L4=list();L5=list();L6=list();L7=list()
-    L8=list();L9=list();L10=list();L11=list();L12=list();L13=list();L14=list();
-    
-    W_TIME = pd.to_timedelta('0 days 22:00:00')
-    if LG.Queue_type == 1:
-        S_W = (ref_load*0.0 + 1) * ((ref_load[START_TIME_Q:END_TIME_Q].max())*P_U_B)
-    if LG.Queue_type == 2:
-        S_W = ref_load*P_U_B
-    
-    APP_L_obj = makeAPP(LG.DF_A,LG.DF_ZIP_summer,LG.DF_ZIP_winter,LG.DF_ZIP_spring,LG.APP_parameter_list)
-    app_expected_load,app_expected_dur,appliance_set,t_delta_exp_dur,app_index = SeasonUPdate(APP_L_obj[season(current_time,'north')])
-    
-    dates = ref_load.index
-    while current_time < END_TIME_Q:
-        m_t_plus_delta = ref_load.asof(where=current_time+t_delta_exp_dur)
-        lambda_t = m_t_plus_delta / (app_expected_load*app_expected_dur) #lam(t) = m(t + E[D])/(E[D]E[L])
-        
-        delta_t = np.random.exponential(1.0/lambda_t) #lambda_t is the rate parameter, numpy requires the scale which is the reciprocal of rate. Alternatively can switch the calculation of lambda_t, but this way matches the derived equations.
-        if delta_t < 0.00000003:
-            delta_t = 0.00000003
-        current_time += pd.to_timedelta('%s s' % (delta_t*3600.0)) #converted to seconds as some delta_t in hours was too small for pandas to parse correctly
-        
-        if current_time < END_TIME_Q: #check after time is updated we are still in sim time
-            ###########################################
-            #Season 
-            ###########################################
-            app_expected_load,app_expected_dur,appliance_set,t_delta_exp_dur,app_index = SeasonUPdate(APP_L_obj[season(current_time,'north')])
-
-            app = appliance_set[np.random.choice(app_index,size=1,replace=True)[0]]
-            V_W = (customer_loads_GL[dates.asof(current_time):dates.asof(current_time+W_TIME)] + app.power) < (S_W[dates.asof(current_time):dates.asof(current_time+W_TIME)])
-            add_time = current_time
-            while add_time <= current_time + W_TIME:
-                VV_W = V_W[dates.asof(add_time):dates.asof(add_time + pd.to_timedelta('%s h' % app.duration))]
-                VV_W_L = VV_W.index[VV_W == True].tolist()
-                if len(VV_W_L) >= VV_W.size:
-                    break
-                add_time += TIME_DELT
-            
-            this_app_endtime = add_time + pd.to_timedelta('%s h' % app.duration)
-            this_app_curtime = add_time
-            
-            customer_loads_GL[dates.asof(this_app_curtime):dates.asof(this_app_endtime)] += app.power
-            customer_loads_GL_VAR[dates.asof(this_app_curtime):dates.asof(this_app_endtime)] += app.reactive
-            
-            L1.append(dates.asof(this_app_curtime))#['start time']=dates.asof(this_app_curtime)
-            L2.append(pd.to_timedelta('%s h' % app.duration).round('1min'))#['duration']=pd.to_timedelta('%s h' % app.duration).round('1min')
-            L3.append(app.power)#['power']=app.power
-            L4.append(app.skedulable)#['skedulable']=app.skedulable
-            L5.append(pd.to_timedelta('%s h' % app.SWn).round('1min'))#['shifting window -']=pd.to_timedelta('%s h' % app.SWn).round('1min')
-            L6.append(pd.to_timedelta('%s h' % app.SWp).round('1min'))#['shifting window +']=pd.to_timedelta('%s h' % app.SWp).round('1min')
-            L7.append(app.reactive)#['reactive']=app.reactive
-            L8.append(app.Zp)#['Zp']=app.Zp
-            L9.append(app.Ip)#['Ip']=app.Ip
-            L10.append(app.Pp)#['Pp']=app.Pp
-            L11.append(app.Zq)#['Zq']=app.Zq
-            L12.append(app.Iq)#['Iq']=app.Iq
-            L13.append(app.Pq)#['Pq']=app.Pq
-            L14.append(app.indeX)#['indeX']=app.indeX
-            
-    sagra = pd.DataFrame({'start time': L1,
-                 'duration': L2,
-                 'power': L3,
-                 'skedulable': L4,
-                 'shifting window -': L5,
-                 'shifting window +': L6,
-                 'reactive': L7,
-                 'Zp': L8,
-                 'Ip': L9,
-                 'Pp': L10,
-                 'Zq': L11,
-                 'Iq': L12,
-                 'Pq': L13,
-                 'indeX': L14
-                })     
-
-    sagra = sagra[sagra['start time'] >= START_TIME_Q]
-    sagra = sagra.reset_index(drop=True)
-    sagra = sagra[sagra['start time'] <= END_TIME_Q]
-    sagra = sagra.reset_index(drop=True)
+    W_TIME = int(pd.to_timedelta('0 days 22:00:00') // LG.TIME_DELT)
+    
+    rng = home_rng(LG.seed,x)
+    APP_L_obj = home_appliances(rng)
+    t_arrival,apps = queue_arrivals(APP_L_obj,LG.ref_arr,LG.season_arr,LG.horizon,rng)
+    
+    headroom = LG.capacity_curve().copy() #S_W - load, updated after each placement
+    t_start = place_arrivals(headroom,t_arrival,apps,W_TIME)
     
-    customer_loads_GL = customer_loads_GL[START_TIME_Q:END_TIME_Q]
-    customer_loads_GL_VAR = customer_loads_GL_VAR[START_TIME_Q:END_TIME_Q]
-    activeANDreactive = pd.DataFrame({'W':customer_loads_GL, 'VAR':customer_loads_GL_VAR})
+    return queue_output(LG.dates,LG.START_TIME_Q,LG.END_TIME_Q,t_start,apps)
 
+def solverZIPl_C(x):
+    """ Generate load with C <-- limited and save it to the home files
+    
+    Parameters
+    ----------
+    x (str): string number of the individual home id
+    
+    Returns
+    ----------
+    x (str): string number of the individual home id
+    """
+    sagra,activeANDreactive = loadZIPl_C(x)
     save_HD5(sagra,activeANDreactive,x)
     return x
 
-###########################################
-# Where to solve
-###########################################   
-def SDSU_cluster():
-    """ Generate load with multiple nodes
+def generate_home(x):
+    """ Generate load for the queue type in LG without saving it (every point of SWEEP when set)
+    
+    Parameters
+    ----------
+    x (str): string number of the individual home id
+    
+    Returns
+    ----------
+    sagra (pandas dataframe): complete  dataframe
+    activeANDreactive (pandas dataframe): summary dataframe
     """
-    x = [str(i) for i in range(1,LG.NUM_HOMES+1)]
+    if LG.SWEEP is not None:
+        return sweep_home(x)
     if LG.Queue_type == 2 or LG.Queue_type == 1:
-        returnValues = list(futures.map(solverZIPl_C, x))
-    else:
-        returnValues = list(futures.map(solverZIPl_inf, x))
-    print("\n".join(returnValues))
+        return loadZIPl_C(x)
+    return loadZIPl_inf(x)
+
+def home_events(x):
+    """ Served appliances of a home for the queue type in LG, before building any dataframe
+    
+    Parameters
+    ----------
+    x (str): string number of the individual home id
     
-def local():
-    """ Generate load with a single node
+    Returns
+    ----------
+    t_start (numpy array): time each appliance starts being served in minutes from START_TIME_Q
+    apps (dict of numpy arrays): characteristics of each served appliance (see app_columns)
     """
-    p = multiprocessing.Pool(LG.NUM_WORKERS)
-    x = [str(i) for i in range(1,LG.NUM_HOMES+1)]
+    rng = home_rng(LG.seed,x)
+    APP_L_obj = home_appliances(rng)
+    t_arrival,apps = queue_arrivals(APP_L_obj,LG.ref_arr,LG.season_arr,LG.horizon,rng)
     if LG.Queue_type == 2 or LG.Queue_type == 1:
-        p.map(solverZIPl_C, x)
-    else:
-        p.map(solverZIPl_inf, x)
-    p.close()
-    p.join()
-    
-###########################################
-# Global Object 
-###########################################
-#load start time, end time, type, 200%, 1 node, 2 workers, 4 homes
-LG = load_generation('2154-11-06 00:00:00','2154-11-08 00:00:00',2,2,2,2,79)
-LG.read_data() # read input data
-LG.base_max  = 5000.0 #rescaling load reference uper bound 
-LG.base_min  =  100.0 #rescaling load reference lower bound 
-LG.APP_parameter_list = [0.5,100,500,100,0.5,0.25,6.0,2.0]#[p.u. percentage of schedulable appliances 0.5=50%,(int) appliance set size,(int) average power rating in Watts,(int) stander power rating in Watts,(float) average duration in hours,(float) stander duration in hours,(float) average duration of the scheduling window in hours,(float) stander duration of the scheduling window in hours]
-###########################################
-# Main
-###########################################
-if __name__ == '__main__':
-    __spec__ = "ModuleSpec(name='builtins', loader=<class '_frozen_importlib.BuiltinImporter'>)"
+        W_TIME = int(pd.to_timedelta('0 days 22:00:00') // LG.TIME_DELT)
+        return place_arrivals(LG.capacity_curve().copy(),t_arrival,apps,W_TIME),apps
+    return t_arrival,apps
+
+def solverZIPl_binary(x):
+    """ Generate load for the queue type in LG and save the events as a compact event log
     
-    start_time = timeit.default_timer()
-    print("Time it takes initialize:")
-    print(timeit.default_timer() - start_time)
-    start_time = timeit.default_timer()
-#    solverZIPl_inf('40')
-#    solverZIPl_C('41')
-    if LG.physical_machine == 1:
-        local()
-    if LG.physical_machine == 2:
-        SDSU_cluster()
+    Parameters
+    ----------
+    x (str): string number of the individual home id
     
-    print("Time it takes [all costomer] :")
-    print(timeit.default_timer() - start_time)
-
+    Returns
+    ----------
+    x (str): string number of the individual home id
+    """
+    t_start,apps = home_events(x)
+    with IN.phase('output'):
+        activeANDreactive = summary_frame(LG.dates,LG.START_TIME_Q,LG.END_TIME_Q,t_start,apps)
+    save_binary(t_start,apps,activeANDreactive,x)
+    return x
+
+WRITER = None #background writer of this process, see home_writer
+
+def home_writer():
+    """ Background writer of this process, started on first use
+    
+    Returns
+    ----------
+    writer (BackgroundWriter): WRITER_THREADS threads behind a queue of WRITE_QUEUE homes
+    """
+    global WRITER
+    if WRITER is None or WRITER.pid != os.getpid(): #threads do not survive a fork
+        WRITER = BW.BackgroundWriter(LG.WRITER_THREADS,LG.WRITE_QUEUE)
+        WRITER.pid = os.getpid()
+    return WRITER
+
+def solverZIPl_pipelined(xs):
+    """ Generate a batch of homes handing their files to the background writer
+    
+    Each home is queued for writing as soon as it is generated, so the files of
+    a home are written while the next one is generated. The batch returns, or
+    raises, once all its queued files are on disk.
+    
+    Parameters
+    ----------
+    xs (list of str): string numbers of the individual home ids
+    
+    Returns
+    ----------
+    xs (list of str): string numbers of the individual home ids
+    """
+    writer = home_writer()
+    try:
+        for x in xs:
+            if LG.SWEEP is not None:
+                job = (save_HD5,)+tuple(sweep_home(x))+(x,)
+            elif LG.EVENT_FORMAT == 'binary':
+                t_start,apps = home_events(x)
+                with IN.phase('output'):
+                    activeANDreactive = summary_frame(LG.dates,LG.START_TIME_Q,LG.END_TIME_Q,t_start,apps)
+                job = (save_binary,t_start,apps,activeANDreactive,x)
+            elif LG.Queue_type == 2 or LG.Queue_type == 1:
+                job = (save_HD5,)+tuple(loadZIPl_C(x))+(x,)
+            else:
+                job = (save_HD5,)+tuple(loadZIPl_inf(x))+(x,)
+            with IN.phase('write wait'):
+                writer.submit(*job)
+    except BaseException:
+        #drain the homes already queued so a retry does not race their writes,
+        #the error of the home being generated is the one raised
+        try:
+            writer.flush()
+        except Exception:
+            pass
+        raise
+    with IN.phase('write wait'):
+        writer.flush()
+    stats = writer.take()
+    IN.count('queued writes',stats['writes'])
+    IN.count('write queue depth',stats['depth'])
+    return xs
+
+def solverZIPl_arrays(x):
+    """ Generate load for the queue type in LG and write it into its row of the population arrays
+    
+    Parameters
+    ----------
+    x (str): string number of the individual home id
+    
+    Returns
+    ----------
+    x (str): string number of the individual home id
+    """
+    t_start,apps = home_events(x)
+    with IN.phase('output'):
+        activeANDreactive = summary_frame(LG.dates,LG.START_TIME_Q,LG.END_TIME_Q,t_start,apps)
+    with IN.phase('write'):
+        if LG._arrays is None:
+            LG._arrays = PS.PopulationArrays(LG.OUT_PUT_ARRAYS,mode='r+')
+        LG._arrays.write(x,activeANDreactive)
+    return x
+
+###########################################
+#Sweep of the capacity
+###########################################
+def sweep_label(point):
+    """ Column suffix of a sweep point e.g. 'q2 pub1.5'
+    
+    Parameters
+    ----------
+    point (tuple): (Queue_type, P_U_B)
+    """
+    return 'q%d pub%g' % (point[0],point[1])
+
+def sweep_home(x):
+    """ Generate a home for every point of LG.SWEEP with common random numbers
+    
+    The appliance sets and the arrivals are drawn once, only the placement
+    under the capacity of each point is run again, so the points differ by
+    their capacity only and a sweep costs one generation plus one placement
+    per point.
+    
+    Parameters
+    ----------
+    x (str): string number of the individual home id
+    
+    Returns
+    ----------
+    sagra (pandas dataframe): complete dataframe, 'start time' is the arrival of each appliance
+        and 'start time <point>' the time it is served at each point (NaT past END_TIME_Q)
+    activeANDreactive (pandas dataframe): summary dataframe with 'W <point>' and 'VAR <point>' columns
+    """
+    W_TIME = int(pd.to_timedelta('0 days 22:00:00') // LG.TIME_DELT)
+    rng = home_rng(LG.seed,x)
+    APP_L_obj = home_appliances(rng)
+    t_arrival,apps = queue_arrivals(APP_L_obj,LG.ref_arr,LG.season_arr,LG.horizon,rng)
+    
+    with IN.phase('output'):
+        sagra = events_frame(LG.dates,LG.START_TIME_Q,LG.END_TIME_Q,t_arrival,apps) #every arrival is inside the horizon
+        summary = {}
+    for point in LG.SWEEP:
+        if point[0] == 2 or point[0] == 1:
+            t_start = place_arrivals(capacity(LG.ref_arr,LG.horizon,point[0],point[1]),t_arrival,apps,W_TIME)
+        else:
+            t_start = t_arrival
+        with IN.phase('output'):
+            label = sweep_label(point)
+            start = LG.dates[np.floor(t_start).astype(np.int64)]
+            sagra['start time '+label] = start.where(start <= LG.END_TIME_Q)
+            load = summary_frame(LG.dates,LG.START_TIME_Q,LG.END_TIME_Q,t_start,apps)
+            summary['W '+label] = load['W']
+            summary['VAR '+label] = load['VAR']
+    return sagra,pd.DataFrame(summary)
+
+def solverZIPl_sweep(x):
+    """ Generate a home for every point of LG.SWEEP and save it to the home files
+    
+    Parameters
+    ----------
+    x (str): string number of the individual home id
+    
+    Returns
+    ----------
+    x (str): string number of the individual home id
+    """
+    sagra,activeANDreactive = sweep_home(x)
+    save_HD5(sagra,activeANDreactive,x)
+    return x
+
+###########################################
+#Streaming by windows
+###########################################
+def stream_home(x,window=None):
+    """ Generate a home window by window with memory bounded by the window size
+    
+    Only what spills over the end of a window is carried to the next one: the
+    load already committed by appliances running or shifted past the boundary
+    (and, for the C limited queue, the headroom left). Arrivals are drawn window
+    by window, which is exact for the Poisson arrival process, so the homes have
+    the same statistics as loadZIPl_inf and loadZIPl_C (not the same draws).
+    
+    Parameters
+    ----------
+    x (str): string number of the individual home id
+    window (str): window length e.g. '1 days', None = LG.STREAM_WINDOW
+    
+    Returns
+    ----------
+    windows (generator): complete and summary dataframes of each window in order
+    """
+    window = int(pd.to_timedelta(window or LG.STREAM_WINDOW) // LG.TIME_DELT)
+    constrained = LG.Queue_type == 2 or LG.Queue_type == 1
+    W_TIME = int(pd.to_timedelta('0 days 22:00:00') // LG.TIME_DELT)
+    n = len(LG.ref_arr)
+    
+    rng = home_rng(LG.seed,x)
+    APP_L_obj = home_appliances(rng)
+    exp_load,exp_dur = season_expectations(APP_L_obj)
+    #minutes past the end of a window an appliance that arrived inside it can still run
+    carry = W_TIME + 2 + int(np.ceil(max(temp.duration.max() for temp in APP_L_obj)*60.0))
+    
+    S_W = LG.capacity_curve()
+    headroom = S_W[:0].copy()
+    load = np.zeros((0,2))
+    w0 = 0
+    while w0 < LG.horizon:
+        w1 = min(w0 + window,LG.horizon)
+        b1 = min(w1 + carry,n) #the buffers cover the minutes w0 ... b1-1
+        if constrained:
+            headroom = np.concatenate((headroom,S_W[w0+len(headroom):b1]))
+        load = np.concatenate((load,np.zeros((b1 - w0 - len(load),2))))
+        
+        lam = QK.intensity(LG.ref_arr,LG.season_arr[w0:w1],exp_load,exp_dur,w0)
+        t_arrival,apps = queue_arrivals(APP_L_obj,LG.ref_arr,LG.season_arr[w0:w1],w1 - w0,rng,lam) #minutes from w0
+        if constrained:
+            t_start = place_arrivals(headroom,t_arrival,apps,W_TIME)
+        else:
+            t_start = t_arrival
+        with IN.phase('output'):
+            start_idx = np.floor(t_start).astype(np.int64)
+            end_idx = np.minimum(np.floor(t_start + apps['duration']*60.0).astype(np.int64),b1 - w0 - 1)
+            W,VAR = QK.accumulate_load(start_idx,end_idx,apps['power'],apps['reactive'],b1 - w0)
+            load[:,0] += W
+            load[:,1] += VAR
+            
+            out = w1 if w1 < LG.horizon else LG.horizon + 1 #END_TIME_Q is part of the last window
+            activeANDreactive = pd.DataFrame({'W':load[:out-w0,0], 'VAR':load[:out-w0,1]},index=LG.dates[w0:out])
+            sagra = events_frame(LG.dates,LG.START_TIME_Q,LG.END_TIME_Q,t_start + w0,apps)
+        yield sagra,activeANDreactive
+        
+        headroom = headroom[w1-w0:].copy()
+        load = load[w1-w0:].copy()
+        w0 = w1
+
+def solverZIPl_stream(x):
+    """ Generate a home window by window, appending each window to the home files
+    
+    Parameters
+    ----------
+    x (str): string number of the individual home id
+    
+    Returns
+    ----------
+    x (str): string number of the individual home id
+    """
+    mode = 'w'
+    for sagra,activeANDreactive in stream_home(x):
+        with IN.phase('write'):
+            sagra.to_hdf(LG.OUT_PUT_FILE_NAME_pre+LG.OUT_PUT_FILE_NAME+x+LG.OUT_PUT_FILE_NAME_end, key=x,format='table',mode=mode,append=True,dropna = True)
+            activeANDreactive.to_hdf(LG.OUT_PUT_FILE_NAME_summary_pre+LG.OUT_PUT_FILE_NAME_summary+x+LG.OUT_PUT_FILE_NAME_end, key=x,format='table',mode=mode,append=True,dropna = True)
+        mode = 'a'
+    count_written(LG.OUT_PUT_FILE_NAME_pre+LG.OUT_PUT_FILE_NAME+x+LG.OUT_PUT_FILE_NAME_end,
+                  LG.OUT_PUT_FILE_NAME_summary_pre+LG.OUT_PUT_FILE_NAME_summary+x+LG.OUT_PUT_FILE_NAME_end)
+    return x
+
+###########################################
+#Batch of homes
+###########################################
+def simulate_homes(xs):
+    """ Simulate several homes at once for the queue type in LG
+    
+    Each home keeps its own random stream, so every row is the same as
+    generating that home alone; the arrival rates, the load accumulation and
+    the event columns are computed for all homes together. The appliance sets,
+    the arrival draws and the placement stay a loop over the homes: the draws
+    come from the stream of each home and the placement is sequential within a
+    home, so batching them would change the homes. Most of the time of a home is
+    spent sampling its appliance sets, so the batch costs about the same per
+    home as generating the homes one by one; it folds K homes into the matrices
+    of the feeder aggregate and of ZIPLoad without building a dataframe per home.
+    
+    Parameters
+    ----------
+    xs (list of str): string numbers of the individual home ids
+    
+    Returns
+    ----------
+    W (numpy array): active load in Watts, homes x minutes from START_TIME_Q to END_TIME_Q
+    VAR (numpy array): reactive load in VARs, homes x minutes
+    events (dict of numpy arrays): served appliances of all homes (see app_columns),
+        plus 'home' (row in xs) and 't_start' (minutes from START_TIME_Q)
+    """
+    K = len(xs)
+    rngs = [home_rng(LG.seed,x) for x in xs]
+    APP = [home_appliances(rng) for rng in rngs]
+    exp_load,exp_dur = zip(*[season_expectations(APP_L_obj) for APP_L_obj in APP])
+    lam = QK.intensity_batch(LG.ref_arr,LG.season_arr[:LG.horizon],exp_load,exp_dur)
+    constrained = LG.Queue_type == 2 or LG.Queue_type == 1
+    W_TIME = int(pd.to_timedelta('0 days 22:00:00') // LG.TIME_DELT)
+    parts = []
+    for k in range(K): #per home on purpose, see the docstring
+        t_arrival,apps = queue_arrivals(APP[k],LG.ref_arr,LG.season_arr,LG.horizon,rngs[k],lam[k])
+        if constrained:
+            apps['t_start'] = place_arrivals(LG.capacity_curve().copy(),t_arrival,apps,W_TIME)
+        else:
+            apps['t_start'] = t_arrival
+        apps['home'] = np.full(len(t_arrival),k,dtype=np.int64)
+        parts.append(apps)
+    events = {name: np.concatenate([apps[name] for apps in parts]) for name in parts[0]}
+    
+    with IN.phase('output'):
+        n = len(LG.ref_arr)
+        start_idx = np.floor(events['t_start']).astype(np.int64)
+        end_idx = np.minimum(np.floor(events['t_start'] + events['duration']*60.0).astype(np.int64), n - 1)
+        W,VAR = QK.accumulate_load_batch(events['home'],start_idx,end_idx,events['power'],events['reactive'],K,n)
+    return W[:,:LG.horizon+1],VAR[:,:LG.horizon+1],events
+
+def aggregate_homes(xs):
+    """ Generate a batch of homes and fold them into a partial feeder aggregate
+    
+    Parameters
+    ----------
+    xs (list of str): string numbers of the individual home ids
+    
+    Returns
+    ----------
+    agg (FeederAggregate): W and VAR statistics of the batch
+    """
+    agg = PS.FeederAggregate(LG.dates[:LG.horizon+1],LG.FEEDER_EDGES)
+    for i in range(0,len(xs),LG.KERNEL_BATCH):
+        W,VAR,events = simulate_homes(xs[i:i+LG.KERNEL_BATCH])
+        agg.add_batch(W,VAR)
+    return agg
+
+def zip_homes(xs):
+    """ Voltage dependent load of a batch of homes, for voltage studies
+    
+    Parameters
+    ----------
+    xs (list of str): string numbers of the individual home ids
+    
+    Returns
+    ----------
+    load (ZIPLoad): load.evaluate(v) gives W and VAR of the homes (rows in xs order)
+        at a voltage profile v in p.u. (see zip_voltage.ZIPLoad)
+    """
+    W,VAR,events = simulate_homes(xs)
+    return ZV.ZIPLoad.from_events(events,LG.DF_A,len(xs),LG.horizon+1)
+
+def feeder_aggregate(parts):
+    """ Reduce the partial feeder aggregates of the workers (or of the shards)
+    
+    Parameters
+    ----------
+    parts (iterable of FeederAggregate): partial aggregates
+    
+    Returns
+    ----------
+    agg (FeederAggregate): feeder aggregate of all the parts
+    """
+    agg = PS.FeederAggregate(LG.dates[:LG.horizon+1],LG.FEEDER_EDGES)
+    for part in parts:
+        agg.merge(part)
+    return agg
+
+def feeder_result(parts):
+    """ Reduce the partial feeder aggregates of the workers
+    
+    Parameters
+    ----------
+    parts (iterable of FeederAggregate): partial aggregates
+    
+    Returns
+    ----------
+    feeder (pandas dataframe): feeder level W and VAR (see FeederAggregate.result)
+    """
+    return feeder_aggregate(parts).result(LG.FEEDER_QUANTILES)
+
+###########################################
+# Where to solve
+###########################################   
+def solve(sched,x,task):
+    """ Run the homes through the scheduler into the output selected by LG.output_mode
+    
+    Parameters
+    ----------
+    sched (Scheduler): scheduler of the execution backend
+    x (list of str): string numbers of the individual home ids
+    task (function): worker function by name for the backend (pool_task or scoop_task)
+    
+    Returns
+    ----------
+    feeder (pandas dataframe): feeder aggregate when output_mode is 'aggregate', else None
+    """
+    feeder = None
+    if LG.STREAM_WINDOW is not None and LG.output_mode != 'files':
+        raise ValueError('STREAM_WINDOW streams the per-home files, the %r output mode generates whole homes' % (LG.output_mode,))
+    if LG.STREAM_WINDOW is not None and LG.EVENT_FORMAT == 'binary':
+        raise ValueError("STREAM_WINDOW appends the windows to HDF5 files, it cannot be combined with EVENT_FORMAT='binary'")
+    if LG.CACHE_FOLDER is not None and LG.seed is None:
+        raise ValueError('CACHE_FOLDER needs a seed, homes generated without one cannot be reused')
+    if LG.STREAM_WINDOW is not None and LG.WRITER_THREADS:
+        raise ValueError('STREAM_WINDOW writes each window as it is generated, it cannot be combined with WRITER_THREADS')
+    if LG.SWEEP is not None and LG.output_mode != 'files':
+        raise ValueError('SWEEP needs the files output mode, not %r' % (LG.output_mode,))
+    if LG.SWEEP is not None and LG.STREAM_WINDOW is not None:
+        raise ValueError('SWEEP cannot be combined with STREAM_WINDOW, the sweep generates whole homes')
+    if LG.SWEEP is not None and LG.EVENT_FORMAT == 'binary':
+        raise ValueError("SWEEP writes HDF5 files, it cannot be combined with EVENT_FORMAT='binary'")
+    if LG.output_mode == 'aggregate' and LG.FEEDER_QUANTILES and LG.FEEDER_EDGES is None:
+        raise ValueError('FEEDER_QUANTILES needs FEEDER_EDGES (the W bins of the percentile sketch)')
+    if LG.output_mode == 'aggregate':
+        #each task folds a batch of homes, this process only merges the batches
+        LG.feeder = feeder_aggregate(part for batch,part in sched.map_batches(task('aggregate_homes'),x))
+        feeder = LG.feeder.result(LG.FEEDER_QUANTILES)
+    elif LG.output_mode == 'store':
+        #workers only generate, this process is the single writer of the store
+        with PS.PopulationWriter(LG.OUT_PUT_STORE) as writer:
+            for home,(sagra,activeANDreactive) in sched.map(task('generate_home'),x):
+                writer.append(home,sagra,activeANDreactive)
+    elif LG.output_mode == 'arrays':
+        #every worker writes its homes straight into their rows of the arrays
+        PS.PopulationArrays.create(LG.OUT_PUT_ARRAYS,x,LG.dates[:LG.horizon+1])
+        LG._arrays = None
+        for home,result in sched.map(task('solverZIPl_arrays'),x):
+            pass
+    else:
+        cache = None
+        if LG.CACHE_FOLDER is not None:
+            #homes with a fixed seed are reproducible, reuse the ones already generated
+            cache = RC.ResultCache(LG.CACHE_FOLDER,LG.CACHE_MAX_BYTES,LG.CACHE_MAX_ENTRIES)
+            key = cache_key()
+            cached = [home for home in x if cache.has(key,home_files(home))]
+            for home in cached:
+                cache.restore(key,home_files(home))
+            if LG.REPORT is not None:
+                print('homes %d/%d restored from the cache' % (len(cached),len(x)))
+            cached = set(cached)
+            x = [home for home in x if home not in cached]
+        if LG.WRITER_THREADS:
+            results = ((home,result) for homes,result in sched.map_batches(task('solverZIPl_pipelined'),x) for home in homes)
+        else:
+            results = sched.map(task(files_solver()),x)
+        for home,result in results:
+            if cache is not None:
+                cache.store(key,home_files(home))
+        if cache is not None:
+            cache.evict(keep=[key])
+    LG.timings = sched.timings
+    LG.failed = sched.failed
+    if sched.sink is not None:
+        sched.sink.close()
+        LG.profile = sched.sink
+    return feeder
+
+def files_solver():
+    """ Name of the worker function writing the per-home files for the settings in LG
+    """
+    if LG.SWEEP is not None:
+        return 'solverZIPl_sweep'
+    if LG.STREAM_WINDOW is not None:
+        return 'solverZIPl_stream'
+    if LG.EVENT_FORMAT == 'binary':
+        return 'solverZIPl_binary'
+    if LG.Queue_type == 2 or LG.Queue_type == 1:
+        return 'solverZIPl_C'
+    return 'solverZIPl_inf'
+
+def home_files(x):
+    """ Files written for a home by files_solver
+    
+    Parameters
+    ----------
+    x (str): string number of the individual home id
+    
+    Returns
+    ----------
+    paths (list of str): complete and summary files of the home
+    """
+    events = EL.EXTENSION if files_solver() == 'solverZIPl_binary' else LG.OUT_PUT_FILE_NAME_end
+    return [LG.OUT_PUT_FILE_NAME_pre+LG.OUT_PUT_FILE_NAME+x+events,
+            LG.OUT_PUT_FILE_NAME_summary_pre+LG.OUT_PUT_FILE_NAME_summary+x+LG.OUT_PUT_FILE_NAME_end]
+
+def cache_key():
+    """ Result cache key of the settings in LG
+    
+    Everything that changes the homes is part of the key: horizon, queue type,
+    capacity, appliance parameters, reference scaling, hemisphere, streaming
+    window, event format, seed and the content of the input files. The number
+    of homes is not, so a larger population reuses the homes of a smaller one.
+    
+    Returns
+    ----------
+    key (str): hexadecimal digest
+    """
+    config = {'version': 2,
+              'START_TIME_Q': str(LG.START_TIME_Q),
+              'END_TIME_Q': str(LG.END_TIME_Q),
+              'Queue_type': LG.Queue_type,
+              'P_U_B': LG.P_U_B,
+              'APP_parameter_list': list(LG.APP_parameter_list),
+              'base_max': LG.base_max,
+              'base_min': LG.base_min,
+              'HEMISPHERE': LG.HEMISPHERE,
+              'STRATUM': LG.STRATUM,
+              'SWEEP': LG.SWEEP,
+              'STREAM_WINDOW': LG.STREAM_WINDOW,
+              'EVENT_FORMAT': LG.EVENT_FORMAT,
+              'seed': LG.seed}
+    files = [LG.input_folder+name for name in ('load_data.h5','ZIP_appliances.csv','ZIP_summer.csv','ZIP_winter.csv','ZIP_spring.csv')]
+    return RC.config_key(config,files)
+
+def profile_sink():
+    """ Sink of the per-home metrics selected by LG.PROFILE
+    
+    Returns
+    ----------
+    sink (function): receives (home, metrics), None when PROFILE is off
+    """
+    if LG.PROFILE is None:
+        return None
+    return IN.make_sink(LG.PROFILE)
+
+def pool_task(name):
+    """ Worker function by name for a multiprocessing pool
+    
+    Parameters
+    ----------
+    name (str): name of the worker function
+    
+    Returns
+    ----------
+    func (function): picklable worker function
+    """
+    return globals()[name]
+
+def scoop_task(name):
+    """ Worker function by name for scoop, run through scoop_call
+    
+    Parameters
+    ----------
+    name (str): name of the worker function
+    
+    Returns
+    ----------
+    func (function): picklable worker function
+    """
+    return functools.partial(scoop_call,name)
+
+def scoop_call(name,arg):
+    """ Run a worker function on a scoop node, loading LG from the shared snapshot first
+    
+    Parameters
+    ----------
+    name (str): name of the worker function
+    arg: argument of the worker function
+    
+    Returns
+    ----------
+    result: return of the worker function
+    """
+    global LG
+    if LG is None:
+        from scoop import shared
+        LG = pickle.loads(shared.getConst('LG_SNAPSHOT'))
+        IN.enable(LG.PROFILE is not None)
+    return globals()[name](arg)
+
+def homes():
+    """ Home ids 1 ... NUM_HOMES
+    """
+    return [str(i) for i in range(1,LG.NUM_HOMES+1)]
+
+def SDSU_cluster(x=None):
+    """ Generate load with multiple nodes (scoop)
+    
+    Parameters
+    ----------
+    x (list of str): home ids, None = all homes
+    """
+    from scoop import futures,shared #only needed by this backend
+    shared.setConst(LG_SNAPSHOT=LG.snapshot())
+    x = homes() if x is None else x
+    sched = SC.Scheduler(futures.map_as_completed,LG.NUM_WORKERS,LG.BATCH_SIZE,LG.RETRIES,LG.REPORT,profile_sink())
+    return solve(sched,x,scoop_task)
+    
+def init_worker(snapshot,spec):
+    """ Pool initializer, load LG from the parent snapshot and attach the shared arrays
+    
+    Parameters
+    ----------
+    snapshot (bytes): returned by load_generation.snapshot
+    spec (dict): returned by load_generation.share_arrays
+    """
+    global LG
+    LG = pickle.loads(snapshot)
+    LG.attach_arrays(spec)
+    IN.enable(LG.PROFILE is not None)
+    
+def local(x=None):
+    """ Generate load with a single node (process pool)
+    
+    Parameters
+    ----------
+    x (list of str): home ids, None = all homes
+    """
+    spec = LG.share_arrays()
+    p = multiprocessing.Pool(LG.NUM_WORKERS,initializer=init_worker,initargs=(LG.snapshot(),spec))
+    x = homes() if x is None else x
+    try:
+        sched = SC.Scheduler(p.imap_unordered,LG.NUM_WORKERS,LG.BATCH_SIZE,LG.RETRIES,LG.REPORT,profile_sink())
+        feeder = solve(sched,x,pool_task)
+    finally:
+        p.close()
+        p.join()
+        LG.release_arrays()
+    return feeder
+
+def serial(x=None):
+    """ Generate load in this process, one home after the other (debugging and profiling)
+    
+    Parameters
+    ----------
+    x (list of str): home ids, None = all homes
+    """
+    x = homes() if x is None else x
+    sched = SC.Scheduler(map,1,LG.BATCH_SIZE,LG.RETRIES,LG.REPORT,profile_sink())
+    return solve(sched,x,pool_task)
+
+###########################################
+# Shards
+###########################################
+def shard_path(path,shard):
+    """ Output partition of a shard
+    
+    Parameters
+    ----------
+    path (str): file or folder (ending in a separator) of the whole population
+    shard (int): shard number
+    
+    Returns
+    ----------
+    path (str): e.g. population.shard0.h5 or population.shard0/
+    """
+    if path.endswith(('/',os.sep)):
+        return path.rstrip('/'+os.sep)+'.shard%d' % shard+os.sep
+    root,ext = os.path.splitext(path)
+    return root+'.shard%d' % shard+ext
+
+def shard_config():
+    """ Configuration of LG for the shard processes
+    
+    Returns
+    ----------
+    config (dict): entries of CONFIG and the output settings with the values of LG
+    """
+    settings = list(CONFIG)+['OUT_PUT_FILE_NAME_pre','OUT_PUT_FILE_NAME','OUT_PUT_FILE_NAME_end',
+                             'OUT_PUT_FILE_NAME_summary_pre','OUT_PUT_FILE_NAME_summary','OUT_PUT_STORE',
+                             'OUT_PUT_FEEDER','OUT_PUT_ARRAYS','FEEDER_EDGES','FEEDER_QUANTILES',
+                             'CACHE_MAX_ENTRIES','REPORT']
+    config = {key: getattr(LG,key) for key in settings if key != 'input_folder'}
+    config['input_folder'] = LG.input_folder
+    config['START_TIME_Q'] = str(LG.START_TIME_Q)
+    config['END_TIME_Q'] = str(LG.END_TIME_Q)
+    return config
+
+def run_shard(shard):
+    """ Generate the homes of a shard into its own output partition and write its manifest
+    
+    The homes 1 ... NUM_HOMES are split in SHARDS contiguous ranges; the shard
+    runs its range with a process pool of NUM_WORKERS. Per-home files do not
+    overlap between shards, the store, arrays and feeder aggregate are written
+    to shard_path partitions, merged (or listed) by merge_shards.
+    
+    Parameters
+    ----------
+    shard (int): shard number, 0 ... SHARDS-1
+    
+    Returns
+    ----------
+    manifest (dict): homes, failed homes and outputs of the shard
+    """
+    start = timeit.default_timer()
+    x = SC.shard_items(homes(),shard,LG.SHARDS)
+    outputs = []
+    if LG.output_mode == 'store':
+        LG.OUT_PUT_STORE = shard_path(LG.OUT_PUT_STORE,shard)
+        outputs.append(LG.OUT_PUT_STORE)
+    elif LG.output_mode == 'arrays':
+        LG.OUT_PUT_ARRAYS = shard_path(LG.OUT_PUT_ARRAYS,shard)
+        outputs.append(LG.OUT_PUT_ARRAYS)
+    local(x)
+    if LG.output_mode == 'aggregate':
+        outputs.append(shard_path(os.path.splitext(LG.OUT_PUT_FEEDER)[0]+'.npz',shard))
+        LG.feeder.save(outputs[-1])
+    manifest = {'shard': shard, 'shards': LG.SHARDS, 'output_mode': LG.output_mode,
+                'homes': x, 'failed': list(LG.failed), 'outputs': outputs,
+                'seconds': timeit.default_timer() - start}
+    if not os.path.isdir(LG.SHARD_FOLDER):
+        os.makedirs(LG.SHARD_FOLDER)
+    path = os.path.join(LG.SHARD_FOLDER,'shard%d.json' % shard)
+    with open(path+'.tmp','w') as f:
+        json.dump(manifest,f,indent=1)
+    os.replace(path+'.tmp',path) #a manifest is only there once the shard is done
+    return manifest
 
+def merge_shards():
+    """ Merge the manifests of all shards (and the feeder aggregates)
+    
+    Returns
+    ----------
+    feeder (pandas dataframe): feeder aggregate of all shards when output_mode is 'aggregate', else None
+    """
+    manifests = []
+    missing = []
+    for shard in range(LG.SHARDS):
+        path = os.path.join(LG.SHARD_FOLDER,'shard%d.json' % shard)
+        if not os.path.exists(path):
+            missing.append(shard)
+            continue
+        with open(path) as f:
+            manifests.append(json.load(f))
+    if missing:
+        raise RuntimeError('shards without a manifest (not run or failed): %s' % missing)
+    feeder = None
+    if LG.output_mode == 'aggregate':
+        index = LG.dates[:LG.horizon+1]
+        LG.feeder = feeder_aggregate(PS.FeederAggregate.load(m['outputs'][0],index) for m in manifests)
+        feeder = LG.feeder.result(LG.FEEDER_QUANTILES)
+    LG.failed = [home for m in manifests for home in m['failed']]
+    manifest = {'shards': LG.SHARDS, 'output_mode': LG.output_mode,
+                'homes': [home for m in manifests for home in m['homes']],
+                'failed': LG.failed,
+                'outputs': [path for m in manifests for path in m['outputs']],
+                'seconds': [m['seconds'] for m in manifests]}
+    with open(os.path.join(LG.SHARD_FOLDER,'manifest.json'),'w') as f:
+        json.dump(manifest,f,indent=1)
+    return feeder
+
+def sharded():
+    """ Generate load with the homes split in SHARDS independent shards
+    
+    With SHARD set this process runs that shard only (e.g. one per node of a
+    cluster job, followed by a run with --merge). Otherwise every shard is
+    launched here as its own process group, which runs the shards of a cluster
+    on one machine, and the manifests are merged at the end.
+    """
+    if LG.SHARD is not None:
+        run_shard(LG.SHARD)
+        return None
+    if not os.path.isdir(LG.SHARD_FOLDER):
+        os.makedirs(LG.SHARD_FOLDER)
+    for shard in range(LG.SHARDS): #no manifest left from an earlier run
+        path = os.path.join(LG.SHARD_FOLDER,'shard%d.json' % shard)
+        if os.path.exists(path):
+            os.remove(path)
+    config = os.path.join(LG.SHARD_FOLDER,'config.json')
+    with open(config,'w') as f:
+        json.dump(shard_config(),f,indent=1,default=lambda value: value.tolist() if hasattr(value,'tolist') else str(value))
+    procs = [subprocess.Popen([sys.executable,os.path.abspath(__file__),'--config',config,'--shard',str(shard)])
+             for shard in range(LG.SHARDS)]
+    for proc in procs:
+        proc.wait()
+    return merge_shards()
+
+BACKENDS = {'serial': serial, #this process
+            'process': local, #process pool of a single node
+            'scoop': SDSU_cluster, #multiple nodes through scoop
+            'shard': sharded} #independent shards, merged at the end
+    
+###########################################
+# Configuration
+###########################################
+#load start time, end time, type, 200%, 2 nodes, 2 workers, 79 homes
+CONFIG = {'START_TIME_Q': '2154-11-06 00:00:00', #start time to generate load data
+          'END_TIME_Q': '2154-11-08 00:00:00', #end time to generate load data
+          'Queue_type': 2, #0=inf; 1=C; 2=Ct
+          'P_U_B': 2, #percentage upper boud --> e.g. 2 = 200% from the reference
+          'physical_machine': 2, #1 = single node 2 = multiple nodes
+          'NUM_WORKERS': 2, #number of workers used when generating load in a single node
+          'NUM_HOMES': 79, #number of homes being generated
+          'base_max': 5000.0, #rescaling load reference uper bound 
+          'base_min': 100.0, #rescaling load reference lower bound 
+          'output_mode': 'files', #'files' = two HDF5 files per home; 'store' = one population store (outputdata/population.h5); 'arrays' = W and VAR of all homes as memory-mapped arrays (outputdata/population/); 'aggregate' = feeder only (outputdata/feederHDF.h5)
+          'BATCH_SIZE': None, #homes per task, None = guided batches (large first, small at the end)
+          'KERNEL_BATCH': 16, #homes simulated together in the feeder aggregation (memory: homes x minutes x 24 bytes)
+          'SWEEP': None, #e.g. [(1,2.0),(2,1.5),(2,2.0)] generates every (Queue_type, P_U_B) point from the same appliances and arrivals, side by side in the per-home files
+          'RETRIES': 2, #times a failed home is tried again
+          'BACKEND': None, #'serial', 'process', 'scoop' or 'shard'; None = 'process' or 'scoop' from physical_machine
+          'SHARDS': 1, #shards of the 'shard' backend, each one a contiguous range of homes with its own outputs
+          'SHARD': None, #shard run by this process, None = launch every shard on this machine and merge
+          'SHARD_FOLDER': 'outputdata/shards/', #manifests of the shards (shard<i>.json, merged in manifest.json)
+          'EVENT_FORMAT': 'hdf', #'hdf' = complete dataframe per home; 'binary' = compact event log per home (outputdata/multy/multHDF<home>.npz, read with event_log.read_events)
+          'STREAM_WINDOW': None, #e.g. '1 days' generates and writes each home one window at a time (files output only), None = whole horizon at once
+          'WRITER_THREADS': 0, #writer threads per worker, the worker generates the next homes while they save the files (files output), 0 = write in the worker
+          'WRITE_QUEUE': 4, #homes waiting to be written before the worker blocks (bounds the memory)
+          'HEMISPHERE': 'north', #north or south, hemisphere of the seasons of the appliance sets
+          'STRATUM': 'P_D', #stratum of the appliance participation P_A ... P_F, or e.g. {'P_A': 0.3, 'P_D': 0.7} to draw the stratum of each home
+          'CACHE_FOLDER': None, #e.g. 'cache/' reuses the per-home files already generated with the same configuration and seed (files output), None = no cache
+          'CACHE_MAX_BYTES': None, #size limit of the cache, the least recently used configurations are removed first
+          'REF_CACHE_FOLDER': None, #e.g. 'cache/' keeps the reference load in minutes of each horizon and scaling, so the workers do not rebuild it
+          'PROFILE': None, #'memory', 'log' or 'file.csv' collects per-phase timers and counters of every home, None = off (no overhead)
+          'seed': None, #master seed of the per home random streams, set an int to make the homes reproducible
+          'APP_parameter_list': [0.5,100,500,100,0.5,0.25,6.0,2.0], #[p.u. percentage of schedulable appliances 0.5=50%,(int) appliance set size,(int) average power rating in Watts,(int) stander power rating in Watts,(float) average duration in hours,(float) stander duration in hours,(float) average duration of the scheduling window in hours,(float) stander duration of the scheduling window in hours]
+          'input_folder': 'inputdata/'}
+
+LG = None #load_generation object, set by setup in the parent and by the initializer in the workers
+
+def setup(config=None):
+    """ Create LG from a configuration and prepare its input data
+    
+    Parameters
+    ----------
+    config (dict): entries overriding CONFIG (keys are load_generation attributes)
+    
+    Returns
+    ----------
+    LG (load_generation): object used by the solvers
+    """
+    global LG
+    conf = copy.deepcopy(CONFIG) #LG must not share the lists and dictionaries of CONFIG or config
+    conf.update(copy.deepcopy(config or {}))
+    LG = load_generation(conf.pop('START_TIME_Q'),conf.pop('END_TIME_Q'),conf.pop('Queue_type'),conf.pop('P_U_B'),
+                         conf.pop('physical_machine'),conf.pop('NUM_WORKERS'),conf.pop('NUM_HOMES'))
+    input_folder = conf.pop('input_folder')
+    for key,value in conf.items():
+        if not hasattr(LG,key):
+            raise AttributeError('unknown configuration entry: %s' % key)
+        setattr(LG,key,value)
+    LG.read_data(input_folder) # read input data
+    IN.enable(LG.PROFILE is not None)
+    return LG
+
+def run(config=None):
+    """ Generate the load of all homes
+    
+    Parameters
+    ----------
+    config (dict): entries overriding CONFIG (see setup)
+    
+    Returns
+    ----------
+    feeder (pandas dataframe): feeder aggregate when output_mode is 'aggregate', else None
+    """
+    start_time = timeit.default_timer()
+    setup(config)
+    print("Time it takes initialize:")
+    print(timeit.default_timer() - start_time)
+    start_time = timeit.default_timer()
+    backend = LG.BACKEND or ('process' if LG.physical_machine == 1 else 'scoop')
+    if backend not in BACKENDS:
+        raise ValueError('BACKEND must be in %s, not %r' % (', '.join(sorted(BACKENDS)),backend))
+    feeder = BACKENDS[backend]()
+    if LG.output_mode == 'aggregate' and feeder is not None: #a single shard only writes its partition
+        feeder.to_hdf(LG.OUT_PUT_FEEDER, key='feeder',format='table',mode='w')
+    
+    print("Time it takes [all costomer] :")
+    print(timeit.default_timer() - start_time)
+    if isinstance(LG.profile,IN.MemorySink):
+        totals = LG.profile.totals()
+        print("Time per phase [all costomer] :")
+        for name,seconds in sorted(totals['seconds'].items()):
+            print('%s %.3f s' % (name,seconds))
+        for name,value in sorted(totals['counts'].items()):
+            print('%s %d' % (name,value))
+    return feeder
+
+def sweep_points(text):
+    """ Sweep points of the command line
+    
+    Parameters
+    ----------
+    text (str): Queue_type:P_U_B pairs separated by commas e.g. "1:2,2:1.5"
+    
+    Returns
+    ----------
+    points (list of tuples): (Queue_type, P_U_B) of each point
+    """
+    points = []
+    for item in text.split(','):
+        queue,pub = item.split(':')
+        points.append((int(queue),float(pub)))
+    return points
+
+def main(argv=None):
+    """ Command line entry point, options override CONFIG
+    
+    Parameters
+    ----------
+    argv (list of str): command line arguments (default sys.argv)
+    """
+    parser = argparse.ArgumentParser(description='Generate synthetic residential load')
+    parser.add_argument('--start',dest='START_TIME_Q',help='start time e.g. "2154-11-06 00:00:00"')
+    parser.add_argument('--end',dest='END_TIME_Q',help='end time')
+    parser.add_argument('--queue-type',dest='Queue_type',type=int,choices=[0,1,2],help='0=inf; 1=C; 2=Ct')
+    parser.add_argument('--pub',dest='P_U_B',type=float,help='capacity upper bound, 2 = 200%% from the reference')
+    parser.add_argument('--machine',dest='physical_machine',type=int,choices=[1,2],help='1 = single node 2 = multiple nodes')
+    parser.add_argument('--backend',dest='BACKEND',choices=['serial','process','scoop','shard'],help='execution backend')
+    parser.add_argument('--shards',dest='SHARDS',type=int,help='number of shards of the shard backend')
+    parser.add_argument('--shard',dest='SHARD',type=int,help='run this shard only (0 ... shards-1)')
+    parser.add_argument('--merge',action='store_true',help='only merge the manifests of the shards')
+    parser.add_argument('--config',help='JSON file of configuration entries (the options override it)')
+    parser.add_argument('--workers',dest='NUM_WORKERS',type=int,help='workers of a single node')
+    parser.add_argument('--homes',dest='NUM_HOMES',type=int,help='number of homes')
+    parser.add_argument('--base-max',dest='base_max',type=float,help='rescaling load reference uper bound')
+    parser.add_argument('--base-min',dest='base_min',type=float,help='rescaling load reference lower bound')
+    parser.add_argument('--output',dest='output_mode',choices=['files','store','arrays','aggregate'],help='output sink')
+    parser.add_argument('--sweep',dest='SWEEP',type=sweep_points,help='sweep points Queue_type:P_U_B e.g. "1:2,2:1.5,2:2"')
+    parser.add_argument('--seed',dest='seed',type=int,help='master seed')
+    parser.add_argument('--cache',dest='CACHE_FOLDER',help='folder of the result cache (needs --seed)')
+    parser.add_argument('--cache-max-bytes',dest='CACHE_MAX_BYTES',type=int,help='size limit of the result cache')
+    parser.add_argument('--profile',dest='PROFILE',help='per-phase timers and counters of every home: memory, log or a .csv file')
+    parser.add_argument('--stratum',dest='STRATUM',choices=list(A_ZIP.STRATA),help='stratum of the appliance participation')
+    parser.add_argument('--hemisphere',dest='HEMISPHERE',choices=['north','south'],help='hemisphere of the seasons')
+    parser.add_argument('--events',dest='EVENT_FORMAT',choices=['hdf','binary'],help='format of the per-home events')
+    parser.add_argument('--writers',dest='WRITER_THREADS',type=int,help='writer threads per worker (files output)')
+    parser.add_argument('--window',dest='STREAM_WINDOW',help='generate each home by windows e.g. "1 days"')
+    parser.add_argument('--batch-size',dest='BATCH_SIZE',type=int,help='homes per task (default guided batches)')
+    parser.add_argument('--retries',dest='RETRIES',type=int,help='times a failed home is tried again')
+    parser.add_argument('--input',dest='input_folder',help='folder of input data')
+    args = parser.parse_args(argv)
+    if args.PROFILE == 'log':
+        logging.basicConfig(level=logging.INFO,format='%(message)s')
+    config = {}
+    if args.config is not None:
+        with open(args.config) as f:
+            config = json.load(f)
+    config.update({key: value for key,value in vars(args).items() if value is not None and key not in ('merge','config')})
+    if args.merge:
+        setup(config)
+        feeder = merge_shards()
+        if feeder is not None:
+            feeder.to_hdf(LG.OUT_PUT_FEEDER, key='feeder',format='table',mode='w')
+        return feeder
+    return run(config)
+
+###########################################
+# Main
+###########################################
+if __name__ == '__main__':
+    __spec__ = "ModuleSpec(name='builtins', loader=<class '_frozen_importlib.BuiltinImporter'>)"
+    main()
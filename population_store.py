@@ -0,0 +1,489 @@
+"""
+@author: Fernando Bereta dos Reis
+
+file: population_store.py
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+###########################################
+# Population writer
+###########################################
+class PopulationWriter(object):
+    """ Write every home of a population into a single HDF5 store
+
+    Only one process may write the store: the workers return their homes and
+    the parent appends them (see main_queue.local and main_queue.SDSU_cluster).
+
+    Attributes
+    ----------
+    path (str): file of the store
+    partition (int): number of consecutive home ids per event table
+    store (pandas HDFStore): open store
+
+    Layout
+    ------
+    summary: one table, index = time, columns home, W and VAR (home id x minute)
+    events/pNNNN: event tables of the homes partition*NNNN ... partition*(NNNN+1)-1,
+        complete dataframe plus the home column
+    """
+    def __init__(self, path, partition=1000, complevel=5, complib='blosc', mode='w'):
+        """ Open the store for writing
+
+        Parameters
+        ----------
+        path (str): file of the store
+        partition (int): number of consecutive home ids per event table
+        complevel (int): compression level
+        complib (str): compression library
+        mode (str): 'w' = new store (an existing file is replaced), 'a' = add homes to an existing store
+        """
+        self.path = path
+        self.partition = partition
+        self.store = pd.HDFStore(path, mode=mode, complevel=complevel, complib=complib)
+
+    def append(self, x, a, b):
+        """ Append a home to the store
+
+        Parameters
+        ----------
+        x (str): string number of the individual home id
+        a (pandas dataframe): complete  dataframe
+        b (pandas dataframe): summary dataframe
+        """
+        home = int(x)
+        b = b.assign(home=home)[['home', 'W', 'VAR']]
+        self.store.append('summary', b, format='table', data_columns=['home'], index=False)
+        a = a.assign(home=home)
+        self.store.append(events_key(home, self.partition), a, format='table', data_columns=['home'], index=False)
+
+    def close(self):
+        """ Index the home column and close the store
+        """
+        for key in self.store.keys():
+            self.store.create_table_index(key, columns=['home'], optlevel=6, kind='medium')
+        self.store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def events_key(home, partition=1000):
+    """ Key of the event table holding a home
+
+    Parameters
+    ----------
+    home (int): home id
+    partition (int): number of consecutive home ids per event table
+
+    Returns
+    ----------
+    key (str): key in the store
+    """
+    return 'events/p%04d' % (home // partition)
+
+###########################################
+# Population readers
+###########################################
+def read_home(path, x, partition=1000):
+    """ Read a home back from the store
+
+    Parameters
+    ----------
+    path (str): file of the store
+    x (str): string number of the individual home id
+    partition (int): number of consecutive home ids per event table
+
+    Returns
+    ----------
+    a (pandas dataframe): complete  dataframe
+    b (pandas dataframe): summary dataframe
+    """
+    home = int(x)
+    with pd.HDFStore(path, mode='r') as store:
+        a = store.select(events_key(home, partition), where='home == %d' % home)
+        b = store.select('summary', where='home == %d' % home)
+    a = a.drop(columns='home').reset_index(drop=True)
+    b = b.drop(columns='home')
+    return a, b
+
+def feeder_aggregate(path, chunksize=1000000):
+    """ Aggregate W and VAR of every home in the store with one sequential scan
+
+    Parameters
+    ----------
+    path (str): file of the store
+    chunksize (int): rows read at a time
+
+    Returns
+    ----------
+    agg (pandas dataframe): W and VAR summed over the homes, index = time
+    """
+    agg = None
+    with pd.HDFStore(path, mode='r') as store:
+        for chunk in store.select('summary', columns=['W', 'VAR'], chunksize=chunksize):
+            part = chunk.groupby(level=0).sum()
+            agg = part if agg is None else agg.add(part, fill_value=0.0)
+    return agg
+
+###########################################
+# Memory-mapped population
+###########################################
+class PopulationArrays(object):
+    """ W and VAR of a population as homes x minutes arrays in .npy files
+
+    The arrays are memory-mapped: slicing reads only the rows and minutes asked
+    for. Each home is a row, so several processes can write different homes of
+    the same files at once (see main_queue.solverZIPl_arrays).
+
+    Attributes
+    ----------
+    folder (str): folder of the arrays
+    W (numpy memmap): active load in Watts, homes x minutes
+    VAR (numpy memmap): reactive load in VARs, homes x minutes
+    homes (numpy array): home id of each row
+    index (pandas DatetimeIndex): minutes of the columns
+
+    Layout
+    ------
+    W.npy, VAR.npy: homes x minutes
+    homes.npy: home id of each row
+    index.npy: minutes of the columns (datetime64[ns])
+    """
+    def __init__(self, folder, mode='r'):
+        """ Open the arrays of a population
+
+        Parameters
+        ----------
+        folder (str): folder of the arrays (see create)
+        mode (str): 'r' to read, 'r+' to write homes
+        """
+        self.folder = folder
+        self.W = np.load(os.path.join(folder, 'W.npy'), mmap_mode=mode)
+        self.VAR = np.load(os.path.join(folder, 'VAR.npy'), mmap_mode=mode)
+        self.homes = np.load(os.path.join(folder, 'homes.npy'))
+        self.index = pd.DatetimeIndex(np.load(os.path.join(folder, 'index.npy')))
+        self._row = dict((int(home), row) for row, home in enumerate(self.homes))
+
+    @classmethod
+    def create(cls, folder, homes, index, dtype=np.float32):
+        """ Create empty (zero) arrays for a population
+
+        Parameters
+        ----------
+        folder (str): folder of the arrays
+        homes (list of str): home ids, one row each
+        index (pandas DatetimeIndex): minutes of the summary dataframe
+        dtype (numpy dtype): type of W and VAR (float32 halves the size)
+
+        Returns
+        ----------
+        arrays (PopulationArrays): arrays open for writing
+        """
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        for name in ('W', 'VAR'):
+            np.lib.format.open_memmap(os.path.join(folder, name + '.npy'), mode='w+', dtype=dtype,
+                                      shape=(len(homes), len(index))).flush()
+        np.save(os.path.join(folder, 'homes.npy'), np.array([int(x) for x in homes], dtype=np.int64))
+        np.save(os.path.join(folder, 'index.npy'), np.asarray(index.values, dtype='datetime64[ns]'))
+        return cls(folder, mode='r+')
+
+    def __len__(self):
+        return len(self.homes)
+
+    def row(self, x):
+        """ Row of a home
+
+        Parameters
+        ----------
+        x (str): string number of the individual home id
+
+        Returns
+        ----------
+        row (int): row of the home in W and VAR
+        """
+        return self._row[int(x)]
+
+    def write(self, x, b):
+        """ Store the summary dataframe of a home in its row
+
+        Parameters
+        ----------
+        x (str): string number of the individual home id
+        b (pandas dataframe): summary dataframe
+        """
+        row = self.row(x)
+        self.W[row] = b['W'].values
+        self.VAR[row] = b['VAR'].values
+
+    def flush(self):
+        """ Write the changes of the memory maps to the files
+        """
+        self.W.flush()
+        self.VAR.flush()
+
+    def columns(self, start=None, end=None):
+        """ Columns of the minutes from start to end (both included)
+
+        Parameters
+        ----------
+        start (str or pandas datetime): first minute, None = first of the horizon
+        end (str or pandas datetime): last minute, None = last of the horizon
+
+        Returns
+        ----------
+        cols (slice): columns of W and VAR
+        """
+        i = 0 if start is None else self.index.searchsorted(pd.Timestamp(start), side='left')
+        j = len(self.index) if end is None else self.index.searchsorted(pd.Timestamp(end), side='right')
+        return slice(i, j)
+
+    def home(self, x, start=None, end=None):
+        """ Summary dataframe of a home
+
+        Parameters
+        ----------
+        x (str): string number of the individual home id
+        start (str or pandas datetime): first minute, None = first of the horizon
+        end (str or pandas datetime): last minute, None = last of the horizon
+
+        Returns
+        ----------
+        b (pandas dataframe): summary dataframe
+        """
+        row = self.row(x)
+        cols = self.columns(start, end)
+        return pd.DataFrame({'W': self.W[row, cols], 'VAR': self.VAR[row, cols]}, index=self.index[cols])
+
+    def select(self, xs=None, start=None, end=None):
+        """ W and VAR of some homes over a time range
+
+        Consecutive rows give views of the files; any other set of homes is
+        gathered row by row.
+
+        Parameters
+        ----------
+        xs (list of str): home ids, None = every home
+        start (str or pandas datetime): first minute, None = first of the horizon
+        end (str or pandas datetime): last minute, None = last of the horizon
+
+        Returns
+        ----------
+        W (numpy array): active load in Watts, homes x minutes
+        VAR (numpy array): reactive load in VARs, homes x minutes
+        index (pandas DatetimeIndex): minutes of the columns
+        """
+        cols = self.columns(start, end)
+        if xs is None:
+            rows = slice(None)
+        else:
+            rows = np.array([self.row(x) for x in xs], dtype=np.int64)
+            if len(rows) and np.array_equal(rows, np.arange(rows[0], rows[0] + len(rows))):
+                rows = slice(int(rows[0]), int(rows[0]) + len(rows))
+        return self.W[rows, cols], self.VAR[rows, cols], self.index[cols]
+
+    def sample(self, n, minutes=None, rng=None):
+        """ Random homes over a random time window, e.g. for optimizer test cases
+
+        Parameters
+        ----------
+        n (int): number of homes (without replacement)
+        minutes (int): length of the window, None = whole horizon
+        rng (numpy Generator): random generator, a new one if None
+
+        Returns
+        ----------
+        xs (list of str): home ids of the rows
+        W (numpy array): active load in Watts, homes x minutes
+        VAR (numpy array): reactive load in VARs, homes x minutes
+        index (pandas DatetimeIndex): minutes of the columns
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+        rows = np.sort(rng.choice(len(self.homes), size=n, replace=False))
+        minutes = len(self.index) if minutes is None else minutes
+        i = int(rng.integers(0, len(self.index) - minutes + 1))
+        xs = [str(home) for home in self.homes[rows]]
+        return xs, self.W[rows, i:i + minutes], self.VAR[rows, i:i + minutes], self.index[i:i + minutes]
+
+def export_arrays(folder, homes, read, dtype=np.float32):
+    """ Copy the summary dataframes of a generated population into PopulationArrays
+
+    Parameters
+    ----------
+    folder (str): folder of the arrays
+    homes (list of str): home ids
+    read (function): summary dataframe of a home id, e.g. lambda x: read_home(path, x)[1]
+    dtype (numpy dtype): type of W and VAR
+
+    Returns
+    ----------
+    arrays (PopulationArrays): arrays open for reading
+    """
+    arrays = None
+    for x in homes:
+        b = read(x)
+        if arrays is None:
+            arrays = PopulationArrays.create(folder, homes, b.index, dtype)
+        arrays.write(x, b)
+    arrays.flush()
+    return PopulationArrays(folder)
+
+###########################################
+# Feeder aggregation
+###########################################
+class FeederAggregate(object):
+    """ Running feeder statistics of W and VAR, without keeping the homes
+
+    Partial aggregates (e.g. one per worker) are combined with merge.
+
+    Attributes
+    ----------
+    index (pandas DatetimeIndex): minutes of the summary dataframe
+    n (int): number of homes added
+    sum (numpy array): sum of W and VAR over the homes, shape (minutes, 2)
+    sumsq (numpy array): sum of the squares of W and VAR, shape (minutes, 2)
+    edges (numpy array): W bins of the percentile sketch, None to keep no sketch
+    counts (numpy array): homes in each W bin per minute, shape (minutes, bins)
+    """
+    def __init__(self, index, edges=None):
+        """ Create an empty aggregate
+
+        Parameters
+        ----------
+        index (pandas DatetimeIndex): minutes of the summary dataframe
+        edges (numpy array): increasing W bin edges of the percentile sketch,
+            memory is minutes x bins x 4 bytes (None = mean and std only)
+        """
+        self.index = index
+        self.n = 0
+        self.sum = np.zeros((len(index), 2))
+        self.sumsq = np.zeros((len(index), 2))
+        self.edges = None if edges is None else np.asarray(edges, dtype=np.float64)
+        self.counts = None if edges is None else np.zeros((len(index), len(self.edges) - 1), dtype=np.int32)
+
+    def add(self, W, VAR):
+        """ Fold a home into the aggregate
+
+        Parameters
+        ----------
+        W (numpy array): active load in Watts of the home
+        VAR (numpy array): reactive load in VARs of the home
+        """
+        self.add_batch(np.atleast_2d(W), np.atleast_2d(VAR))
+
+    def add_batch(self, W, VAR):
+        """ Fold several homes into the aggregate
+
+        Parameters
+        ----------
+        W (numpy array): active load in Watts, homes x minutes
+        VAR (numpy array): reactive load in VARs, homes x minutes
+        """
+        self.n += W.shape[0]
+        self.sum[:, 0] += W.sum(axis=0)
+        self.sum[:, 1] += VAR.sum(axis=0)
+        self.sumsq[:, 0] += (W*W).sum(axis=0)
+        self.sumsq[:, 1] += (VAR*VAR).sum(axis=0)
+        if self.counts is not None:
+            nbins = self.counts.shape[1]
+            b = np.clip(np.searchsorted(self.edges, W, side='right') - 1, 0, nbins - 1)
+            cells = (np.arange(W.shape[1])*nbins + b).ravel()
+            self.counts += np.bincount(cells, minlength=self.counts.size).reshape(self.counts.shape).astype(np.int32)
+
+    def merge(self, other):
+        """ Fold another aggregate over the same minutes into this one
+
+        Parameters
+        ----------
+        other (FeederAggregate): partial aggregate
+        """
+        self.n += other.n
+        self.sum += other.sum
+        self.sumsq += other.sumsq
+        if self.counts is not None:
+            self.counts += other.counts
+        return self
+
+    def save(self, path):
+        """ Write the partial aggregate (e.g. of a shard) to be merged later
+
+        Parameters
+        ----------
+        path (str): file of the aggregate (.npz)
+        """
+        arrays = {'n': np.array(self.n), 'sum': self.sum, 'sumsq': self.sumsq}
+        if self.counts is not None:
+            arrays.update(edges=self.edges, counts=self.counts)
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path, index):
+        """ Read a partial aggregate written by save
+
+        Parameters
+        ----------
+        path (str): file of the aggregate (.npz)
+        index (pandas DatetimeIndex): minutes of the summary dataframe
+
+        Returns
+        ----------
+        agg (FeederAggregate): partial aggregate
+        """
+        with np.load(path) as data:
+            agg = cls(index, data['edges'] if 'edges' in data else None)
+            agg.n = int(data['n'])
+            agg.sum = data['sum']
+            agg.sumsq = data['sumsq']
+            if agg.counts is not None:
+                agg.counts = data['counts']
+        return agg
+
+    def quantile(self, q):
+        """ W quantile over the homes for every minute, read from the sketch
+
+        Parameters
+        ----------
+        q (float): quantile between 0 and 1
+
+        Returns
+        ----------
+        w (numpy array): W quantile, linear within the bin
+        """
+        if self.counts is None:
+            raise ValueError('W quantiles need the percentile sketch, create the aggregate with edges')
+        cum = np.cumsum(self.counts, axis=1)
+        target = q*self.n
+        b = np.argmax(cum >= target, axis=1)
+        rows = np.arange(len(b))
+        before = np.where(b > 0, cum[rows, b - 1], 0)
+        frac = (target - before) / np.maximum(self.counts[rows, b], 1)
+        return self.edges[b] + np.clip(frac, 0.0, 1.0)*(self.edges[b + 1] - self.edges[b])
+
+    def result(self, quantiles=()):
+        """ Feeder level dataframe
+
+        Parameters
+        ----------
+        quantiles (list of float): W quantiles to add (needs the sketch)
+
+        Returns
+        ----------
+        feeder (pandas dataframe): W and VAR sums, W and VAR mean and standard
+            deviation over the homes and the 'W qXX' quantile columns
+        """
+        n = max(self.n, 1)
+        mean = self.sum / n
+        std = np.sqrt(np.maximum(self.sumsq / n - mean*mean, 0.0))
+        feeder = pd.DataFrame({'W': self.sum[:, 0], 'VAR': self.sum[:, 1],
+                               'W mean': mean[:, 0], 'VAR mean': mean[:, 1],
+                               'W std': std[:, 0], 'VAR std': std[:, 1]}, index=self.index)
+        for q in quantiles:
+            feeder['W q%02d' % round(q*100)] = self.quantile(q)
+        return feeder
@@ -0,0 +1,270 @@
+"""
+@author: Fernando Bereta dos Reis
+
+file: queue_kernels.py
+"""
+import numpy as np
+try:
+    import numba
+except ImportError: #optional, the pure-NumPy path is used instead
+    numba = None
+
+###########################################
+# Arrival intensity
+###########################################
+def intensity(ref, season_idx, exp_load, exp_dur, start=0):
+    """ Arrival rate lam(t) = m(t + E[D])/(E[D]E[L]) for every minute of the horizon
+
+    Parameters
+    ----------
+    ref (numpy array): reference load in Watts at minute resolution
+    season_idx (numpy array): season of each minute (index into exp_load and exp_dur)
+    exp_load (array like): expected load in Watts of the appliance set of each season
+    exp_dur (array like): expected duration in hours of the appliance set of each season
+    start (int): minute of ref where season_idx starts
+
+    Returns
+    ----------
+    lam (numpy array): arrival rate in arrivals per hour for each minute
+    """
+    return intensity_batch(ref, season_idx, [exp_load], [exp_dur], start)[0]
+
+def intensity_batch(ref, season_idx, exp_load, exp_dur, start=0):
+    """ Arrival rate of several homes sharing the same reference load
+
+    Parameters
+    ----------
+    ref (numpy array): reference load in Watts at minute resolution
+    season_idx (numpy array): season of each minute (index into exp_load and exp_dur)
+    exp_load (array like): expected load in Watts, homes x seasons
+    exp_dur (array like): expected duration in hours, homes x seasons
+    start (int): minute of ref where season_idx starts
+
+    Returns
+    ----------
+    lam (numpy array): arrival rate in arrivals per hour, homes x minutes
+    """
+    exp_load = np.asarray(exp_load, dtype=np.float64)
+    exp_dur = np.asarray(exp_dur, dtype=np.float64)
+    n = len(season_idx)
+    lead = np.floor(exp_dur*60.0).astype(np.int64) #E[D] in minutes
+    where = np.minimum(np.arange(start, start + n, dtype=np.int64) + lead[:, season_idx], len(ref) - 1)
+    return ref[where] / (exp_load*exp_dur)[:, season_idx]
+
+###########################################
+# Arrival times
+###########################################
+def arrival_times(lam, rng=None):
+    """ Draw the arrival times of a non-homogeneous Poisson process
+
+    The rate is constant within each minute, so the cumulative intensity is
+    piecewise linear and can be inverted exactly: unit rate arrivals are mapped
+    back to the time axis with a single searchsorted.
+
+    Parameters
+    ----------
+    lam (numpy array): arrival rate in arrivals per hour for each minute of the horizon
+    rng (numpy Generator): random generator of the home, a new one if None
+
+    Returns
+    ----------
+    t (numpy array): arrival times in minutes from the start of the horizon (float64, sorted)
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    rate = lam / 60.0 #arrivals per minute
+    cum = np.concatenate(([0.0], np.cumsum(rate)))
+    total = cum[-1]
+    #draw a bit more than the expected number of arrivals and top up if it was not enough
+    n = int(total + 6.0*np.sqrt(total) + 10)
+    s = np.cumsum(rng.exponential(1.0, size=n))
+    while s[-1] < total:
+        s = np.concatenate((s, s[-1] + np.cumsum(rng.exponential(1.0, size=n))))
+    s = s[s < total]
+
+    idx = np.searchsorted(cum, s, side='right') - 1
+    return idx + (s - cum[idx]) / rate[idx]
+
+###########################################
+# Load accumulation
+###########################################
+def accumulate_load(start_idx, end_idx, P, Q, n):
+    """ Build the active and reactive load curves of a set of appliance runs
+
+    Each run adds its power from start_idx to end_idx (both inclusive). The runs
+    are scattered into a difference array and integrated with one cumsum.
+
+    Parameters
+    ----------
+    start_idx (numpy array): minute index where each appliance starts
+    end_idx (numpy array): minute index where each appliance ends (inclusive)
+    P (numpy array): active power of each appliance in Watts
+    Q (numpy array): reactive power of each appliance in VARs
+    n (int): number of minutes of the curves
+
+    Returns
+    ----------
+    W (numpy array): active load in Watts
+    VAR (numpy array): reactive load in VARs
+    """
+    W, VAR = accumulate_load_batch(np.zeros(len(start_idx), dtype=np.int64), start_idx, end_idx, P, Q, 1, n)
+    return W[0], VAR[0]
+
+def accumulate_load_batch(home, start_idx, end_idx, P, Q, K, n):
+    """ Build the load curves of several homes with one scatter-add
+
+    Parameters
+    ----------
+    home (numpy array): home (row) of each appliance run
+    start_idx (numpy array): minute index where each appliance starts
+    end_idx (numpy array): minute index where each appliance ends (inclusive)
+    P (numpy array): active power of each appliance in Watts
+    Q (numpy array): reactive power of each appliance in VARs
+    K (int): number of homes
+    n (int): number of minutes of the curves
+
+    Returns
+    ----------
+    W (numpy array): active load in Watts, homes x minutes
+    VAR (numpy array): reactive load in VARs, homes x minutes
+    """
+    load = accumulate_columns(home, start_idx, end_idx, np.column_stack((P, Q)), K, n)
+    return load[:, :, 0], load[:, :, 1]
+
+def accumulate_columns(row, start_idx, end_idx, values, R, n):
+    """ Sum per-run values over the minutes each run is active, for several rows at once
+
+    Minutes where no run is active are set to exactly zero (the running sums of
+    the difference array leave round-off there).
+
+    Parameters
+    ----------
+    row (numpy array): row (e.g. home) of each run
+    start_idx (numpy array): minute index where each run starts
+    end_idx (numpy array): minute index where each run ends (inclusive)
+    values (numpy array): values added by each run, runs x columns
+    R (int): number of rows
+    n (int): number of minutes
+
+    Returns
+    ----------
+    sums (numpy array): rows x minutes x columns
+    """
+    C = values.shape[1]
+    base = row*(n + 1)
+    idx = np.concatenate((base + start_idx, base + end_idx + 1))
+    runs = np.column_stack((values, np.ones(len(values))))
+    diff = np.zeros((R*(n + 1), C + 1))
+    np.add.at(diff, idx, np.concatenate((runs, -runs)))
+    sums = np.cumsum(diff.reshape(R, n + 1, C + 1)[:, :-1], axis=1)
+    sums[sums[:, :, C] < 0.5, :C] = 0.0 #no run active, clear round-off
+    return sums[:, :, :C]
+
+###########################################
+# Capacity constrained placement
+###########################################
+def first_fit(headroom, t, dur, P, window=1320):
+    """ Shift in minutes of the first start where an appliance fits under the capacity
+
+    Reproduces the shift search of the C limited queue: starting at the arrival
+    minute a, the start is delayed one minute at a time (up to window minutes)
+    until every minute the appliance runs has headroom larger than its power.
+    Only the minutes up to a + window are checked. The free stretches are found
+    with a run-length scan of the minutes without headroom, instead of one
+    slice per candidate start.
+
+    Parameters
+    ----------
+    headroom (numpy array): capacity minus the load already committed in Watts
+    t (float): arrival time in minutes
+    dur (float): duration of the appliance in hours
+    P (float): active power of the appliance in Watts
+    window (int): shifting window in minutes
+
+    Returns
+    ----------
+    k (int): shift in minutes, window + 1 when no start fits
+    """
+    a = int(t)
+    last = min(a + window, len(headroom) - 1) - a #last minute checked, relative to a
+    span = int(t + dur*60.0) - a #minutes the appliance runs after its start
+    ok = headroom[a:a + last + 1] > P
+    if ok[:min(span, last) + 1].all():
+        return 0
+    bad = np.flatnonzero(~ok)
+    ks = np.arange(window + 1)
+    next_bad = np.append(bad, last + 1)[np.searchsorted(bad, ks)]
+    fits = next_bad > np.minimum(span + ks, last)
+    if fits.any():
+        return int(np.argmax(fits))
+    return window + 1
+
+def place_appliances(headroom, t_arrival, duration, P, window=1320, backend=None):
+    """ Serve the arrivals in order, each at its first feasible start
+
+    Parameters
+    ----------
+    headroom (numpy array): capacity minus committed load in Watts, updated in place
+    t_arrival (numpy array): arrival times in minutes
+    duration (numpy array): duration of each appliance in hours
+    P (numpy array): active power of each appliance in Watts
+    window (int): shifting window in minutes
+    backend (str): 'numba' (compiled loop) or 'numpy', None = BACKEND
+
+    Returns
+    ----------
+    t_start (numpy array): time each appliance starts being served in minutes
+    """
+    if (backend or BACKEND) == 'numba':
+        if numba is None:
+            raise ImportError('numba is not installed, use backend="numpy"')
+        return _place_loop_jit(headroom, np.asarray(t_arrival, dtype=np.float64),
+                               np.asarray(duration, dtype=np.float64), np.asarray(P, dtype=np.float64), window)
+    n = len(headroom)
+    t_start = np.empty(len(t_arrival))
+    for i in range(len(t_arrival)):
+        t = t_arrival[i] + first_fit(headroom, t_arrival[i], duration[i], P[i], window)
+        headroom[int(t):min(int(t + duration[i]*60.0), n - 1) + 1] -= P[i]
+        t_start[i] = t
+    return t_start
+
+def _place_loop(headroom, t_arrival, duration, P, window):
+    """ Arrival, shift search and place loop on plain arrays (compiled with numba)
+
+    Same result as first_fit: a start k is rejected at the first minute j
+    without headroom in its run, and every start up to j contains that minute,
+    so the search continues at j + 1. Each arrival costs O(window + duration).
+    """
+    n = len(headroom)
+    t_start = np.empty(len(t_arrival))
+    for i in range(len(t_arrival)):
+        t = t_arrival[i]
+        a = int(t)
+        last = min(a + window, n - 1) - a
+        span = int(t + duration[i]*60.0) - a
+        k = 0
+        j = 0
+        while k <= window and k <= last:
+            need = min(span + k, last)
+            if j < k:
+                j = k
+            while j <= need and headroom[a + j] > P[i]:
+                j += 1
+            if j > need:
+                break
+            k = j + 1
+        if k > window:
+            k = window + 1
+        start = int(t + k)
+        end = min(int(t + k + duration[i]*60.0), n - 1)
+        for m in range(start, end + 1):
+            headroom[m] -= P[i]
+        t_start[i] = t + k
+    return t_start
+
+if numba is not None:
+    _place_loop_jit = numba.njit(cache=True)(_place_loop)
+    BACKEND = 'numba'
+else:
+    _place_loop_jit = None
+    BACKEND = 'numpy'
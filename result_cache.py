@@ -0,0 +1,178 @@
+"""
+@author: Fernando Bereta dos Reis
+
+file: result_cache.py
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+
+###########################################
+# Keys
+###########################################
+def file_digest(path, chunk=1 << 20):
+    """ SHA-256 of a file
+
+    Parameters
+    ----------
+    path (str): file to hash
+    chunk (int): bytes read at a time
+
+    Returns
+    ----------
+    digest (str): hexadecimal digest
+    """
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def config_key(config, files=()):
+    """ Key of a configuration and of the input files it reads
+
+    Parameters
+    ----------
+    config (dict): everything that changes the generated homes (JSON serializable)
+    files (list of str): input files, hashed by content
+
+    Returns
+    ----------
+    key (str): hexadecimal digest
+    """
+    content = {'config': config, 'files': dict((os.path.basename(path), file_digest(path)) for path in files)}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+###########################################
+# Cache
+###########################################
+class ResultCache(object):
+    """ Generated home files stored by configuration key
+
+    Each key is a folder holding the files of every home generated with that
+    configuration, so a later run with the same configuration only generates
+    the homes that are missing. The least recently used keys are removed when
+    the cache grows past max_bytes or max_entries.
+
+    Attributes
+    ----------
+    folder (str): folder of the cache
+    max_bytes (int): size limit of the cache in bytes, None = no limit
+    max_entries (int): number of keys kept, None = no limit
+    """
+    USED = '.last_used'
+
+    def __init__(self, folder, max_bytes=None, max_entries=None):
+        """ Open (or create) a cache
+
+        Parameters
+        ----------
+        folder (str): folder of the cache
+        max_bytes (int): size limit of the cache in bytes, None = no limit
+        max_entries (int): number of keys kept, None = no limit
+        """
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+    def entry(self, key):
+        """ Folder of a key, created and marked as used
+        """
+        path = os.path.join(self.folder, key)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.touch(key)
+        return path
+
+    def touch(self, key):
+        """ Mark a key as used now (least recently used keys are evicted first)
+        """
+        with open(os.path.join(self.folder, key, self.USED), 'w') as f:
+            f.write('%f' % time.time())
+
+    def has(self, key, paths):
+        """ True when every file of a home is in the cache
+
+        Parameters
+        ----------
+        key (str): configuration key
+        paths (list of str): output files of the home
+        """
+        entry = os.path.join(self.folder, key)
+        return all(os.path.exists(os.path.join(entry, os.path.basename(path))) for path in paths)
+
+    def restore(self, key, paths):
+        """ Copy the cached files of a home to its output files
+
+        Parameters
+        ----------
+        key (str): configuration key
+        paths (list of str): output files of the home
+        """
+        entry = os.path.join(self.folder, key)
+        for path in paths:
+            shutil.copyfile(os.path.join(entry, os.path.basename(path)), path)
+        self.touch(key)
+
+    def store(self, key, paths):
+        """ Copy the output files of a home into the cache
+
+        Parameters
+        ----------
+        key (str): configuration key
+        paths (list of str): output files of the home
+        """
+        entry = self.entry(key)
+        for path in paths:
+            target = os.path.join(entry, os.path.basename(path))
+            shutil.copyfile(path, target + '.tmp')
+            os.replace(target + '.tmp', target) #a home is either complete or missing
+
+    def entries(self):
+        """ Keys in the cache, least recently used first
+
+        Returns
+        ----------
+        entries (list of tuples): (last used time, bytes, key)
+        """
+        entries = []
+        for key in os.listdir(self.folder):
+            path = os.path.join(self.folder, key)
+            if not os.path.isdir(path):
+                continue
+            used = os.path.join(path, self.USED)
+            size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+            entries.append((os.path.getmtime(used) if os.path.exists(used) else 0.0, size, key))
+        return sorted(entries)
+
+    def evict(self, keep=()):
+        """ Remove the least recently used keys until the cache is within its limits
+
+        Parameters
+        ----------
+        keep (list of str): keys never removed (e.g. the one of the current run)
+
+        Returns
+        ----------
+        removed (list of str): keys removed
+        """
+        entries = self.entries()
+        total = sum(size for used, size, key in entries)
+        count = len(entries)
+        removed = []
+        for used, size, key in entries:
+            over_size = self.max_bytes is not None and total > self.max_bytes
+            over_count = self.max_entries is not None and count > self.max_entries
+            if not (over_size or over_count):
+                break
+            if key in keep:
+                continue
+            shutil.rmtree(os.path.join(self.folder, key), ignore_errors=True)
+            total -= size
+            count -= 1
+            removed.append(key)
+        return removed
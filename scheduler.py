@@ -0,0 +1,250 @@
+"""
+@author: Fernando Bereta dos Reis
+
+file: scheduler.py
+"""
+from __future__ import print_function
+import timeit
+import traceback
+
+import instrumentation as IN
+
+###########################################
+# Batches
+###########################################
+def guided_batches(items, workers, min_size=1, max_size=None):
+    """ Split the items in batches of decreasing size (guided self-scheduling)
+
+    Each batch takes a share of what is still left, so the first batches are
+    large (little dispatch overhead) and the last ones small (no worker is left
+    alone with a long batch at the end).
+
+    Parameters
+    ----------
+    items (list): items to split
+    workers (int): number of workers
+    min_size (int): smallest batch
+    max_size (int): largest batch (None = no limit)
+
+    Returns
+    ----------
+    batches (list of lists): batches in order
+    """
+    batches = []
+    i = 0
+    while i < len(items):
+        size = max(min_size, (len(items) - i) // (2*max(1, workers)))
+        if max_size is not None:
+            size = min(size, max_size)
+        batches.append(items[i:i + size])
+        i += size
+    return batches
+
+def fixed_batches(items, size):
+    """ Split the items in batches of the same size
+
+    Parameters
+    ----------
+    items (list): items to split
+    size (int): batch size
+
+    Returns
+    ----------
+    batches (list of lists): batches in order
+    """
+    return [items[i:i + size] for i in range(0, len(items), max(1, size))]
+
+def shard_items(items, shard, shards):
+    """ Contiguous range of the items of a shard, the ranges of all shards cover the items
+
+    Parameters
+    ----------
+    items (list): items to split
+    shard (int): shard number, 0 ... shards - 1
+    shards (int): number of shards
+
+    Returns
+    ----------
+    items (list): items of the shard
+    """
+    if not 0 <= shard < shards:
+        raise ValueError('shard must be in 0 ... %d, not %r' % (shards - 1, shard))
+    return items[shard*len(items)//shards:(shard + 1)*len(items)//shards]
+
+def batch_label(homes):
+    """ Name of a vectorized batch in the timings and the metrics sink
+
+    The worker times and instruments a vectorized batch as a whole, so its
+    records are batch level: a batch of one home is named by the home id, a
+    larger batch by its first and last home and its size.
+
+    Parameters
+    ----------
+    homes (list of str): home ids of the batch, in order
+
+    Returns
+    ----------
+    label (str): e.g. 'batch 1-16 (16 homes)'
+    """
+    if len(homes) == 1:
+        return homes[0]
+    return 'batch %s-%s (%d homes)' % (homes[0], homes[-1], len(homes))
+
+###########################################
+# Worker side
+###########################################
+def run_batch(task):
+    """ Run a batch of homes in a worker, timing each one and catching failures
+
+    Parameters
+    ----------
+    task (tuple): (func, batch, vectorized); func is called once per home, or
+        once with the whole batch when vectorized is True
+
+    Returns
+    ----------
+    out (list of tuples): (home, ok, result or error message, seconds, metrics) per
+        home, a vectorized batch gives a single tuple with the list of homes;
+        metrics is None unless the instrumentation is enabled in the worker
+    """
+    func, batch, vectorized = task
+    calls = [batch] if vectorized else batch
+    out = []
+    for x in calls:
+        start = timeit.default_timer()
+        try:
+            result = func(x)
+            out.append((x, True, result, timeit.default_timer() - start, IN.take()))
+        except Exception:
+            IN.take() #drop what the failed home collected
+            out.append((x, False, traceback.format_exc(), timeit.default_timer() - start, None))
+    return out
+
+###########################################
+# Scheduler
+###########################################
+class Scheduler(object):
+    """ Hand out batches of homes to a worker pool as workers become free
+
+    Attributes
+    ----------
+    imap (function): unordered map of the backend, e.g. Pool.imap_unordered or
+        scoop futures.map_as_completed
+    workers (int): number of workers, used to size the guided batches
+    batch_size (int): fixed batch size, None for guided batches
+    retries (int): times a failed home is tried again
+    report (float): seconds between progress reports (None = silent)
+    sink (function): receives (home, metrics) of every home that succeeded when the
+        workers collect metrics (see instrumentation), None to drop them; for a
+        vectorized batch home is the batch_label and metrics cover the whole batch
+    timings (dict): seconds taken by each home, or by each vectorized batch under its batch_label
+    errors (dict): last error message of each failed home
+    failed (list): homes that failed after all retries
+    """
+    def __init__(self, imap, workers, batch_size=None, retries=2, report=10.0, sink=None):
+        """ Create the scheduler
+
+        Parameters
+        ----------
+        imap (function): unordered map of the backend
+        workers (int): number of workers
+        batch_size (int): fixed batch size, None for guided batches
+        retries (int): times a failed home is tried again
+        report (float): seconds between progress reports (None = silent)
+        sink (function): receives (home, metrics) of every home that succeeded
+        """
+        self.imap = imap
+        self.workers = workers
+        self.batch_size = batch_size
+        self.retries = retries
+        self.report = report
+        self.sink = sink
+        self.timings = {}
+        self.errors = {}
+        self.failed = []
+
+    def map(self, func, items):
+        """ Run func on every home, yielding the results as they finish
+
+        Parameters
+        ----------
+        func (function): worker function of a single home
+        items (list of str): home ids
+
+        Returns
+        ----------
+        results (generator): (home, result) of each home that succeeded
+        """
+        return self._run(func, items, False)
+
+    def map_batches(self, func, items):
+        """ Run func on batches of homes in one call, yielding the results as they finish
+
+        A batch that fails is retried one home at a time.
+
+        Parameters
+        ----------
+        func (function): worker function of a list of homes
+        items (list of str): home ids
+
+        Returns
+        ----------
+        results (generator): (list of homes, result) of each batch that succeeded
+        """
+        return self._run(func, items, True)
+
+    def _batches(self, items):
+        if self.batch_size is None:
+            return guided_batches(items, self.workers)
+        return fixed_batches(items, self.batch_size)
+
+    def _run(self, func, items, vectorized):
+        total = len(items)
+        done = 0
+        start = timeit.default_timer()
+        last = start
+        pending = list(items)
+        for attempt in range(self.retries + 1):
+            failed = []
+            batches = self._batches(pending) if attempt == 0 else fixed_batches(pending, 1)
+            for out in self.imap(run_batch, [(func, batch, vectorized) for batch in batches]):
+                for x, ok, result, seconds, metrics in out:
+                    homes = x if vectorized else [x]
+                    label = batch_label(homes) if vectorized else x
+                    self.timings[label] = seconds
+                    if ok:
+                        done += len(homes)
+                        if self.sink is not None and metrics is not None:
+                            self.sink(label, metrics)
+                        yield x, result
+                    else:
+                        failed.extend(homes)
+                        for home in homes:
+                            self.errors[home] = result
+                now = timeit.default_timer()
+                if self.report is not None and now - last >= self.report:
+                    last = now
+                    print('homes %d/%d  %.1f homes/s  failed %d' % (done, total, done / (now - start), len(failed)))
+            pending = failed
+            if not pending:
+                break
+            if attempt < self.retries and self.report is not None:
+                print('retrying %d homes' % len(pending))
+        self.failed = pending
+        if self.report is not None:
+            self.summary()
+
+    def summary(self, slowest=5):
+        """ Print the run time, the slowest homes (or vectorized batches) and the failed homes
+
+        Parameters
+        ----------
+        slowest (int): number of slowest homes listed
+        """
+        if self.timings:
+            seconds = sorted(self.timings.items(), key=lambda item: -item[1])
+            total = sum(self.timings.values())
+            print('timed %d  mean %.3f s  max %.3f s' % (len(seconds), total / len(seconds), seconds[0][1]))
+            print('slowest: ' + ', '.join('%s (%.3f s)' % item for item in seconds[:slowest]))
+        for home in self.failed:
+            print('home %s failed:\n%s' % (home, self.errors[home]))
@@ -0,0 +1,109 @@
+"""
+@author: Fernando Bereta dos Reis
+
+file: test_queue_kernels.py
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import queue_kernels as QK
+
+START = pd.Timestamp('2154-11-06 00:00:00')
+TIME_DELT = pd.to_timedelta('0 days 00:01:00')
+
+###########################################
+# Reference
+###########################################
+def reference_placement(S_W, t_arrival, duration, P, window):
+    """ Shift search of the original solverZIPl_C on pandas series
+
+    Parameters
+    ----------
+    S_W (numpy array): capacity in Watts for each minute
+    t_arrival (numpy array): arrival times in minutes, in order
+    duration (numpy array): duration of each appliance in hours
+    P (numpy array): active power of each appliance in Watts
+    window (int): shifting window in minutes
+
+    Returns
+    ----------
+    t_start (numpy array): time each appliance starts being served in minutes
+    """
+    dates = pd.date_range(START, periods=len(S_W), freq=TIME_DELT)
+    S_W = pd.Series(S_W, index=dates)
+    customer_loads_GL = S_W*0.0
+    W_TIME = window*TIME_DELT
+    t_start = []
+    for t, dur, power in zip(t_arrival, duration, P):
+        current_time = START + pd.to_timedelta(t, unit='min')
+        V_W = (customer_loads_GL[dates.asof(current_time):dates.asof(current_time + W_TIME)] + power) < (S_W[dates.asof(current_time):dates.asof(current_time + W_TIME)])
+        add_time = current_time
+        while add_time <= current_time + W_TIME:
+            VV_W = V_W[dates.asof(add_time):dates.asof(add_time + pd.to_timedelta(dur, unit='h'))]
+            VV_W_L = VV_W.index[VV_W == True].tolist()
+            if len(VV_W_L) >= VV_W.size:
+                break
+            add_time += TIME_DELT
+        this_app_endtime = add_time + pd.to_timedelta(dur, unit='h')
+        customer_loads_GL[dates.asof(add_time):dates.asof(this_app_endtime)] += power
+        t_start.append((add_time - START)/TIME_DELT)
+    return np.array(t_start)
+
+def random_case(seed, n=600, arrivals=40, window=120):
+    """ Arrivals tight enough under the capacity to be shifted
+
+    Powers and capacities are whole Watts so the load + P < S_W test of the
+    reference and the headroom > P test of the kernels are both exact, and the
+    fractions of the arrival and end times stay away from whole minutes. As in
+    main_queue (the reference load runs one day past END_TIME_Q) the shifting
+    window and the runs of the appliances end inside the series.
+    """
+    rng = np.random.default_rng(seed)
+    S_W = rng.integers(1500, 4000, size=n).astype(np.float64)
+    if seed % 2:
+        S_W[:] = S_W[0] #C limited queue, constant capacity
+    t_arrival = np.sort(rng.integers(0, n - window - 92, size=arrivals) + rng.uniform(0.1, 0.4, size=arrivals))
+    duration = (rng.integers(1, 90, size=arrivals) + rng.uniform(0.1, 0.4, size=arrivals))/60.0
+    P = rng.integers(200, 1500, size=arrivals).astype(np.float64)
+    return S_W, t_arrival, duration, P, window
+
+SEEDS = range(8)
+
+###########################################
+# Tests
+###########################################
+@pytest.mark.parametrize('seed', SEEDS)
+def test_numpy_placement_matches_reference(seed):
+    S_W, t_arrival, duration, P, window = random_case(seed)
+    expected = reference_placement(S_W, t_arrival, duration, P, window)
+    t_start = QK.place_appliances(S_W.copy(), t_arrival, duration, P, window, backend='numpy')
+    np.testing.assert_array_equal(np.floor(t_start), np.floor(expected))
+    np.testing.assert_allclose(t_start, expected, rtol=0, atol=1e-6)
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_place_loop_matches_reference(seed):
+    S_W, t_arrival, duration, P, window = random_case(seed)
+    expected = reference_placement(S_W, t_arrival, duration, P, window)
+    t_start = QK._place_loop(S_W.copy(), t_arrival, duration, P, window)
+    np.testing.assert_array_equal(np.floor(t_start), np.floor(expected))
+    np.testing.assert_allclose(t_start, expected, rtol=0, atol=1e-6)
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_numba_placement_matches_numpy(seed):
+    pytest.importorskip('numba')
+    S_W, t_arrival, duration, P, window = random_case(seed)
+    headroom_numpy = S_W.copy()
+    headroom_numba = S_W.copy()
+    t_numpy = QK.place_appliances(headroom_numpy, t_arrival, duration, P, window, backend='numpy')
+    t_numba = QK.place_appliances(headroom_numba, t_arrival, duration, P, window, backend='numba')
+    np.testing.assert_array_equal(t_numba, t_numpy)
+    np.testing.assert_array_equal(headroom_numba, headroom_numpy)
+
+def test_cases_shift_appliances():
+    shifted = 0
+    for seed in SEEDS:
+        S_W, t_arrival, duration, P, window = random_case(seed)
+        t_start = QK.place_appliances(S_W.copy(), t_arrival, duration, P, window, backend='numpy')
+        shifted += np.count_nonzero(t_start > t_arrival)
+    assert shifted > 0 #the cases exercise the shift search, not only direct placements
@@ -0,0 +1,124 @@
+"""
+@author: Fernando Bereta dos Reis
+
+file: zip_voltage.py
+"""
+import numpy as np
+
+import queue_kernels as QK
+
+###########################################
+# Voltage dependent load
+###########################################
+ZIP_COLUMNS = ['Zp', 'Ip', 'Pp', 'Zq', 'Iq', 'Pq']
+
+class ZIPLoad(object):
+    """ Voltage dependent load of a set of homes, built once and evaluated for any voltage
+
+    With v the voltage in p.u. of the nominal voltage Vo of each appliance,
+    an appliance running at a minute draws
+
+        P(v) = power (Zp v^2 + Ip v + Pp),  Q(v) = reactive (Zq v^2 + Iq v + Pq)
+
+    and nothing when v*Vo <= Vcut. The appliances are grouped by their cut-off
+    Vcut/Vo, and the sums of power*Zp ... reactive*Pq of the appliances running
+    at each minute are built once per group with the difference array, so every
+    evaluation is a few array operations per group whatever the number of events.
+
+    Attributes
+    ----------
+    cut (numpy array): cut-off voltage Vcut/Vo in p.u. of each group
+    sums (numpy array): ZIP_COLUMNS sums, groups x 6 x homes x minutes
+    """
+    def __init__(self, home, start_idx, end_idx, power, reactive, coeffs, cut, K, n):
+        """ Build the coefficient sums of a set of appliance runs
+
+        Parameters
+        ----------
+        home (numpy array): home (row) of each appliance run
+        start_idx (numpy array): minute index where each appliance starts
+        end_idx (numpy array): minute index where each appliance ends (inclusive)
+        power (numpy array): nominal active power of each appliance in Watts
+        reactive (numpy array): nominal reactive power of each appliance in VARs
+        coeffs (numpy array): ZIP_COLUMNS of each appliance, runs x 6
+        cut (numpy array): Vcut/Vo of each appliance
+        K (int): number of homes
+        n (int): number of minutes
+        """
+        keep = start_idx < n
+        start_idx = start_idx[keep]
+        end_idx = np.minimum(end_idx[keep], n - 1)
+        scaled = np.asarray(coeffs, dtype=np.float64)[keep]*np.column_stack((power[keep],)*3 + (reactive[keep],)*3)
+        self.cut, group = np.unique(np.asarray(cut, dtype=np.float64)[keep], return_inverse=True)
+        G = len(self.cut)
+        row = group*K + np.asarray(home)[keep] #one row per group and home
+        sums = QK.accumulate_columns(row, start_idx, end_idx, scaled, G*K, n)
+        self.sums = np.ascontiguousarray(sums.reshape(G, K, n, 6).transpose(0, 3, 1, 2))
+
+    @classmethod
+    def from_events(cls, events, DF_A, K, n):
+        """ Voltage dependent load of the events of main_queue.simulate_homes
+
+        Parameters
+        ----------
+        events (dict of numpy arrays): served appliances with 'home', 't_start' and 'A_type'
+        DF_A (pandas dataframe): apliences caracteristics
+        K (int): number of homes
+        n (int): number of minutes from START_TIME_Q
+
+        Returns
+        ----------
+        load (ZIPLoad): voltage dependent load of the homes
+        """
+        start_idx = np.floor(events['t_start']).astype(np.int64)
+        end_idx = np.floor(events['t_start'] + events['duration']*60.0).astype(np.int64)
+        coeffs = np.column_stack([events[name] for name in ZIP_COLUMNS])
+        cut = (DF_A.Vcut.values/DF_A.Vo.values)[events['A_type']]
+        return cls(events['home'], start_idx, end_idx, events['power'], events['reactive'], coeffs, cut, K, n)
+
+    @classmethod
+    def from_event_logs(cls, logs, DF_A, n):
+        """ Voltage dependent load of homes saved as event logs (see event_log)
+
+        Parameters
+        ----------
+        logs (list of EventLog): event log of each home, one row each
+        DF_A (pandas dataframe): apliences caracteristics
+        n (int): number of minutes from the origin of the logs
+
+        Returns
+        ----------
+        load (ZIPLoad): voltage dependent load of the homes
+        """
+        ev = np.concatenate([log.events for log in logs])
+        home = np.repeat(np.arange(len(logs)), [len(log) for log in logs])
+        types = np.concatenate([log.types[log.events['type']] for log in logs])
+        start_idx = ev['start'].astype(np.int64)
+        end_idx = start_idx + ev['duration'].astype(np.int64)
+        power = ev['power'].astype(np.float64)
+        cut = (DF_A.Vcut.values/DF_A.Vo.values)[ev['type']]
+        return cls(home, start_idx, end_idx, power, types[:, 6]*power, types[:, :6], cut, len(logs), n)
+
+    def evaluate(self, v):
+        """ Active and reactive load at a voltage profile
+
+        Parameters
+        ----------
+        v (numpy array): voltage in p.u., a scalar, one per minute (feeder) or homes x minutes
+
+        Returns
+        ----------
+        P (numpy array): active load in Watts, homes x minutes
+        Q (numpy array): reactive load in VARs, homes x minutes
+        """
+        G, _, K, n = self.sums.shape
+        v = np.broadcast_to(np.asarray(v, dtype=np.float64), (K, n))
+        v2 = v*v
+        P = np.zeros((K, n))
+        Q = np.zeros((K, n))
+        for g in range(G):
+            S = self.sums[g]
+            on = v > self.cut[g]
+            P += np.where(on, S[0]*v2 + S[1]*v + S[2], 0.0)
+            Q += np.where(on, S[3]*v2 + S[4]*v + S[5], 0.0)
+        return P, Q